@@ -0,0 +1,52 @@
+"""
+Merged waste collection agenda over several ICS files.
+Every source (one file per year and provider, e.g. paper, bio or bulky waste)
+is indexed and cached on its own. The sorted event streams of all sources are
+joined with a k-way merge, so the agenda can span the turn of the year and
+combine several providers.
+"""
+import datetime
+import heapq
+import os
+from instrumentation import metrics
+from . import read_abfall_ics
+
+def yearly_sources(directory, start, end, name_template='abfallkalender{year}.ics'):
+    """
+    Returns the paths of the yearly ICS files covering the date range,
+    e.g. abfallkalender2025.ics and abfallkalender2026.ics on December 31.
+    """
+    return [os.path.join(directory, name_template.format(year=year))
+            for year in range(start.year, end.year + 1)]
+
+def get_agenda(sources, start, end, categories=None):
+    """
+    Returns the waste collection events of all ICS sources with
+    start <= DTSTART <= end, sorted by date.
+    Missing sources are skipped, the same pickup listed by several
+    sources is returned once.
+    """
+    with metrics.span('parse'):
+        streams = []
+        for ics_file_path in sources:
+            if not os.path.exists(ics_file_path):
+                print(f"ICS source not found: {ics_file_path}")
+                continue
+            streams.append(read_abfall_ics.categorize(
+                read_abfall_ics.iter_indexed_events(ics_file_path, start, end), categories))
+
+        events = []
+        seen = set()
+        for event in heapq.merge(*streams, key=lambda event: event['start']):
+            key = (event['start'], event['summary'])
+            if key not in seen:
+                seen.add(key)
+                events.append(event)
+        return events
+
+def get_agenda_for_today_and_tomorrow(sources, categories=None):
+    """
+    Returns the merged events of all ICS sources for today and tomorrow.
+    """
+    today = datetime.date.today()
+    return get_agenda(sources, today, today + datetime.timedelta(days=1), categories)
@@ -0,0 +1,139 @@
+"""
+Compiled on-disk index for waste collection ICS files.
+The index is a small JSON file stored next to the ICS file. It holds all events
+sorted by date and is rebuilt only when the ICS file changes, so a lookup costs
+one small file read and a binary search instead of reading the whole calendar.
+Recurring events are stored as rules, their expansion for a window is stored
+in the index as well, so repeated refreshes don't expand them again.
+"""
+import bisect
+import datetime
+import hashlib
+import json
+import os
+from . import recurrence
+
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 3
+# Number of expanded windows of recurring events kept in the index
+MAX_WINDOWS = 8
+
+def index_path_for(ics_file_path):
+    """Return the path of the index file belonging to an ICS file."""
+    return ics_file_path + INDEX_SUFFIX
+
+def file_hash(file_path):
+    """Return the sha1 hex digest of a file."""
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(65536), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def load_index(ics_file_path):
+    """
+    Load the index of an ICS file.
+    Returns None if there is no index or if it is outdated.
+    """
+    index_path = index_path_for(ics_file_path)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as file:
+            index = json.load(file)
+        stat = os.stat(ics_file_path)
+    except (OSError, ValueError):
+        return None
+
+    if index.get('version') != INDEX_VERSION:
+        return None
+    if index['mtime_ns'] == stat.st_mtime_ns and index['size'] == stat.st_size:
+        return index
+
+    # mtime or size changed, only the content hash can tell if the index is still valid
+    if index['sha1'] != file_hash(ics_file_path):
+        return None
+    index['mtime_ns'] = stat.st_mtime_ns
+    index['size'] = stat.st_size
+    _write(index_path, index)
+    return index
+
+def write_index(ics_file_path, events):
+    """
+    Build the index from a list of events and write it next to the ICS file.
+    Events are dicts with 'summary', 'start' and 'end' (datetime.date),
+    recurring events also have 'rrule' and 'exdates'.
+    Returns the index.
+    """
+    stat = os.stat(ics_file_path)
+    rows = []
+    recurring = []
+    for event in events:
+        row = [event['start'].isoformat(), event['end'].isoformat(), event['summary']]
+        if 'rrule' in event:
+            recurring.append(row + [event['rrule'],
+                                    sorted(day.isoformat() for day in event.get('exdates', ()))])
+        else:
+            rows.append(row)
+    rows.sort()
+    index = {
+        'version': INDEX_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha1': file_hash(ics_file_path),
+        'days': [row[0] for row in rows],
+        'events': rows,
+        'recurring': recurring,
+        'windows': {}
+    }
+    _write(index_path_for(ics_file_path), index)
+    return index
+
+def events_between(index, start, end, ics_file_path=None):
+    """
+    Return the index rows [start, end, summary] with start <= DTSTART <= end,
+    using a binary search over the sorted days.
+    Occurrences of recurring events are merged in. If ics_file_path is given,
+    a newly expanded window is stored in the index file.
+    """
+    lower = bisect.bisect_left(index['days'], start.isoformat())
+    upper = bisect.bisect_right(index['days'], end.isoformat())
+    rows = index['events'][lower:upper]
+    if index['recurring']:
+        rows = sorted(rows + _recurring_between(index, start, end, ics_file_path))
+    return rows
+
+def _recurring_between(index, start, end, ics_file_path):
+    """Return the rows of the expanded recurring events within the window."""
+    key = f'{start.isoformat()}/{end.isoformat()}'
+    windows = index['windows']
+    if key in windows:
+        return windows[key]
+
+    rows = []
+    for first_start, first_end, summary, rrule, exdates in index['recurring']:
+        event = {
+            'summary': summary,
+            'start': datetime.date.fromisoformat(first_start),
+            'end': datetime.date.fromisoformat(first_end),
+            'rrule': rrule,
+            'exdates': [datetime.date.fromisoformat(day) for day in exdates]
+        }
+        rows += [[occurrence['start'].isoformat(), occurrence['end'].isoformat(), summary]
+                 for occurrence in recurrence.expand_event(event, start, end)]
+
+    windows[key] = rows
+    # keep only the most recent windows, dicts preserve the insertion order
+    for old_key in list(windows)[:-MAX_WINDOWS]:
+        del windows[old_key]
+    if ics_file_path is not None:
+        _write(index_path_for(ics_file_path), index)
+    return rows
+
+def _write(index_path, index):
+    """Write the index atomically. A read-only location only costs the cache."""
+    tmp_path = index_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(index, file, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        print(f"Error writing ICS index: {e}")
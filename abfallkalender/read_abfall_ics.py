@@ -1,9 +1,185 @@
 """
-This script reads an ICS file containing waste collection events 
-and filters them to find events for today and tomorrow.
+This script reads an ICS file containing waste collection events
+and filters them to find events for today, tomorrow or any other date range.
+The file is read line by line and only the fields needed for the display
+(DTSTART, DTEND, SUMMARY) are kept, so big calendars never have to be held
+in memory as a whole. Parsed events are kept in a compiled index
+(see ics_index.py), so repeated lookups don't need to read the calendar again.
+Recurring events (RRULE with EXDATE) are expanded lazily within the
+requested window (see recurrence.py).
 """
 import datetime
-from icalendar import Calendar
+import os
+import re
+from instrumentation import metrics
+from . import ics_index, recurrence
+
+# Keyword found in the SUMMARY of an event -> category shown on the display.
+# The first matching keyword wins.
+WASTE_CATEGORIES = {
+    "Papier": "Papier",
+    "Restmüll": "Restmüll",
+    "Biomüll": "Biomüll",
+    "Gelber Sack": "Gelber Sack",
+}
+
+# Compiled indexes already loaded by this process, by path of the ICS file
+_loaded_indexes = {}
+
+def _as_date(value):
+    """
+    Return the date part of a date or datetime. UTC times are converted to
+    local time first, feeds write local midnight as 23:00Z of the day before.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone()
+        return value.date()
+    return value
+
+def _parse_date(value):
+    """Parse an ICS DATE (yyyymmdd) or DATE-TIME (yyyymmddThhmmss[Z]) value."""
+    if 'T' in value:
+        parsed = datetime.datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+        if value.endswith('Z'):
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed
+    return datetime.datetime.strptime(value, '%Y%m%d').date()
+
+def _unescape(value):
+    """Undo the ICS text escaping of commas, semicolons, newlines and backslashes."""
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) in 'nN' else match.group(1),
+                  value)
+
+def _unfolded_lines(file):
+    """Yield the logical lines of an ICS file, joining folded continuation lines."""
+    current = None
+    for line in file:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+def _split_property(line):
+    """Split a content line into its name and value, dropping the parameters."""
+    name_part, _, value = line.partition(':')
+    # a quoted parameter value may contain a colon
+    while name_part.count('"') % 2:
+        rest, _, value = value.partition(':')
+        name_part = f'{name_part}:{rest}'
+    return name_part.split(';', 1)[0].upper(), value
+
+def iter_vevents(ics_file_path):
+    """
+    Streams the VEVENTs of an ICS file.
+    Yields dicts with 'summary', 'start' and 'end' (datetime.date) one at a time.
+    Recurring events additionally carry 'rrule' and 'exdates'.
+    """
+    with open(ics_file_path, 'r', encoding='utf-8') as file:
+        components = []
+        event = None
+        for line in _unfolded_lines(file):
+            name, value = _split_property(line)
+            if name == 'BEGIN':
+                components.append(value.upper())
+                if components == ['VCALENDAR', 'VEVENT']:
+                    event = {}
+            elif name == 'END':
+                if components and components.pop() == 'VEVENT' and event is not None:
+                    if 'start' in event:
+                        event.setdefault('end', event['start'])
+                        event.setdefault('summary', '')
+                        yield event
+                    event = None
+            elif event is not None and components[-1] == 'VEVENT':
+                if name == 'DTSTART':
+                    event['start'] = _as_date(_parse_date(value))
+                elif name == 'DTEND':
+                    event['end'] = _as_date(_parse_date(value))
+                elif name == 'SUMMARY':
+                    event['summary'] = _unescape(value)
+                elif name == 'RRULE':
+                    event['rrule'] = value
+                elif name == 'EXDATE':
+                    event.setdefault('exdates', set()).update(
+                        _as_date(_parse_date(exdate)) for exdate in value.split(','))
+
+def parse_events(ics_file_path):
+    """
+    Reads the whole ICS file and returns all events as a list of dicts.
+    """
+    return list(iter_vevents(ics_file_path))
+
+def categorize(events, categories=None):
+    """
+    Yields the events whose summary contains one of the keywords of the
+    keyword-to-category table. The summary is replaced by the category.
+    """
+    categories = WASTE_CATEGORIES if categories is None else categories
+    for event in events:
+        for keyword, category in categories.items():
+            if keyword in event['summary']:
+                yield dict(event, summary=category)
+                break
+
+def get_events_between(ics_file_path, start, end, categories=None, assume_sorted=False):
+    """
+    Streams an ICS file and returns the waste collection events with
+    start <= DTSTART <= end, sorted by date. Recurring events are expanded.
+    With assume_sorted=True reading stops at the first event after the window,
+    for calendars known to list their events in chronological order. Files
+    are not checked for that, the whole file is read by default.
+    """
+    def in_window(events):
+        for event in events:
+            if event['start'] > end:
+                if assume_sorted:
+                    return
+                continue
+            yield from recurrence.expand_event(event, start, end)
+
+    events = categorize(in_window(iter_vevents(ics_file_path)), categories)
+    return sorted(events, key=lambda event: event['start'])
+
+def load_index(ics_file_path):
+    """
+    Returns the compiled index of the ICS file and builds it if necessary.
+    Every file is indexed and cached on its own, a loaded index is kept in
+    memory until its file changes.
+    """
+    stat = os.stat(ics_file_path)
+    index = _loaded_indexes.get(ics_file_path)
+    if index and index['mtime_ns'] == stat.st_mtime_ns and index['size'] == stat.st_size:
+        metrics.count('ics_index', result='memory')
+        return index
+
+    index = ics_index.load_index(ics_file_path)
+    if index is None:
+        metrics.count('ics_index', result='rebuild')
+        index = ics_index.write_index(ics_file_path, parse_events(ics_file_path))
+    else:
+        metrics.count('ics_index', result='disk')
+    _loaded_indexes[ics_file_path] = index
+    return index
+
+def iter_indexed_events(ics_file_path, start, end):
+    """
+    Yields the events with start <= DTSTART <= end from the compiled index,
+    sorted by date.
+    """
+    for event_start, event_end, summary in ics_index.events_between(
+            load_index(ics_file_path), start, end, ics_file_path):
+        yield {
+            'summary': summary,
+            'start': datetime.date.fromisoformat(event_start),
+            'end': datetime.date.fromisoformat(event_end)
+        }
 
 def get_events_for_today_and_tomorrow(ics_file_path):
     """
@@ -13,25 +189,6 @@ def get_events_for_today_and_tomorrow(ics_file_path):
     today = datetime.date.today()
     tomorrow = today + datetime.timedelta(days=1)
 
-    # Read the ICS file
-    with open(ics_file_path, 'r', encoding='utf-8') as file:
-        calendar = Calendar.from_ical(file.read())
-
     # Find events for today and tomorrow
-    events = []
-    for component in calendar.walk():
-        if component.name == "VEVENT":
-            event_start = component.get('DTSTART').dt
-            if event_start in   [today, tomorrow]:
-                summary = component.get('SUMMARY').to_ical().decode('utf-8')
-                # Filter summary to keep only specific keywords
-                for keyword in ["Papier", "Restmüll", "Biomüll", "Gelber Sack"]:
-                    if keyword in summary:
-                        events.append({
-                            'summary': keyword,
-                            'start': event_start,
-                            'end': component.get('DTEND').dt
-                        })
-                        break
-
-    return events
+    # Filter summary to keep only specific keywords
+    return list(categorize(iter_indexed_events(ics_file_path, today, tomorrow)))
@@ -0,0 +1,65 @@
+"""
+Lazy expansion of recurring waste collection events (RRULE with EXDATE).
+Occurrences are generated only inside the requested window, so a rule
+running for years never gets expanded as a whole. Expanded windows are
+cached, so repeated refreshes for the same window don't expand again.
+"""
+import datetime
+import functools
+import re
+from dateutil.rrule import rrulestr
+
+def _local_until(match):
+    """Convert a UTC UNTIL to naive local time, like the DTSTART of the event."""
+    until = datetime.datetime.strptime(match.group(1), '%Y%m%dT%H%M%S')
+    until = until.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    return f"UNTIL={until.strftime('%Y%m%dT%H%M%S')}"
+
+def _naive_until(rrule):
+    """
+    Make UNTIL naive local time, events are expanded on naive local dates and
+    dateutil refuses to combine a naive DTSTART with an aware UNTIL.
+    """
+    rrule = re.sub(r'UNTIL=(\d{8}T\d{6})Z', _local_until, rrule)
+    return re.sub(r'(UNTIL=\d{8})Z', r'\1', rrule)
+
+def iter_occurrences(rrule, dtstart, exdates, start, end):
+    """
+    Yields the dates of a recurring event with start <= date <= end.
+    The rule is only iterated up to the end of the window.
+    """
+    rule = rrulestr(_naive_until(rrule), dtstart=datetime.datetime.combine(dtstart,
+                                                                          datetime.time()))
+    for occurrence in rule.xafter(datetime.datetime.combine(start, datetime.time()), inc=True):
+        occurrence = occurrence.date()
+        if occurrence > end:
+            return
+        if occurrence not in exdates:
+            yield occurrence
+
+@functools.lru_cache(maxsize=256)
+def occurrences_between(rrule, dtstart, exdates, start, end):
+    """
+    Returns the dates of a recurring event within the window as a tuple.
+    exdates must be a frozenset, the result is cached per rule and window.
+    """
+    return tuple(iter_occurrences(rrule, dtstart, exdates, start, end))
+
+def expand_event(event, start, end):
+    """
+    Yields the occurrences of an event within the window as event dicts.
+    Events without a RRULE are yielded unchanged if they start within the window.
+    """
+    if 'rrule' not in event:
+        if start <= event['start'] <= end:
+            yield event
+        return
+
+    duration = event['end'] - event['start']
+    for occurrence in occurrences_between(event['rrule'], event['start'],
+                                          frozenset(event.get('exdates', ())), start, end):
+        yield {
+            'summary': event['summary'],
+            'start': occurrence,
+            'end': occurrence + duration
+        }
@@ -0,0 +1,48 @@
+"""
+Stored benchmark baselines.
+Baselines are kept in benchmarks/baselines.json. Record them on the target
+device (e.g. the Raspberry Pi) by running a benchmark with --update, later runs
+fail if a timing is more than TOLERANCE times its baseline.
+"""
+import json
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINES_PATH = os.path.join(BASE_DIR, 'baselines.json')
+
+# A timing may be this much slower than its baseline before it counts as a regression
+TOLERANCE = 1.25
+
+def load_baselines():
+    """Return the stored baselines as a dict of name -> milliseconds."""
+    try:
+        with open(BASELINES_PATH, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def update_baselines(timings):
+    """Store timings (name -> milliseconds) as the new baselines."""
+    baselines = load_baselines()
+    baselines.update(timings)
+    with open(BASELINES_PATH, 'w', encoding='utf-8') as file:
+        json.dump(baselines, file, indent=2, sort_keys=True)
+
+def check_baselines(timings):
+    """
+    Compare timings with the stored baselines and print the result.
+    Returns the names of the timings that regressed.
+    """
+    baselines = load_baselines()
+    regressions = []
+    for name, value in timings.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:28s} {value:9.1f} ms   (no baseline)")
+            continue
+        status = 'ok'
+        if value > baseline * TOLERANCE:
+            status = 'REGRESSION'
+            regressions.append(name)
+        print(f"{name:28s} {value:9.1f} ms   baseline {baseline:9.1f} ms   {status}")
+    return regressions
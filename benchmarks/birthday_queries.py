@@ -0,0 +1,63 @@
+"""
+Benchmark of the birthday queries with many contacts.
+Generates a birthday database with CONTACTS entries and compares the former
+"whose birthday is today" scan (all rows, compared as dd.mm strings in Python)
+with the indexed queries of BirthdayStore for one date and the next days.
+Run with `python3 -m benchmarks.birthday_queries`, add --update to store the
+result as baseline (see baselines.py). Exits with 1 on a regression.
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+from birthday_push_message.database import BirthdayStore
+from . import baselines
+from .ics_index import timed
+
+CONTACTS = 100000
+REPEAT = 20
+# Days of the upcoming query, across the end of the year
+UPCOMING_DAYS = 14
+UPCOMING_START = datetime.date(2026, 12, 24)
+
+def write_contacts(store, count=CONTACTS):
+    """Add count contacts with random birthdays, a tenth of them without year."""
+    rng = random.Random(0)
+    with store.transaction():
+        for number in range(count):
+            day = datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(366))
+            year = '0999' if number % 10 == 0 else str(rng.randrange(1930, 2020))
+            store.add(f'Person {number}', f'{day.strftime("%d.%m")}.{year}')
+
+def scan_today(store, today):
+    """The query before the month/day columns: every date compared in Python."""
+    day_month = today.strftime("%d.%m")
+    return [birthday for birthday in store.all(today) if birthday.date[:5] == day_month]
+
+def main():
+    """Run the benchmark and compare it with the baselines."""
+    today = datetime.date(2026, 10, 18)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = BirthdayStore(os.path.join(tmp_dir, 'birthdays.db'))
+        write_contacts(store)
+        if scan_today(store, today) != store.on_date(today):
+            print("indexed query differs from the scan")
+            sys.exit(1)
+
+        timings = {
+            'birthdays_scan_today': timed(lambda: scan_today(store, today), REPEAT),
+            'birthdays_on_date': timed(lambda: store.on_date(today), REPEAT),
+            'birthdays_upcoming': timed(lambda: store.upcoming(UPCOMING_DAYS, UPCOMING_START),
+                                        REPEAT),
+        }
+        store.close()
+    print(f"{CONTACTS} contacts: indexed lookup is "
+          f"{timings['birthdays_scan_today'] / timings['birthdays_on_date']:.0f}x faster than the scan")
+    if '--update' in sys.argv:
+        baselines.update_baselines(timings)
+    if baselines.check_baselines(timings):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
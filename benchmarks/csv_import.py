@@ -0,0 +1,86 @@
+"""
+Benchmark of the CSV import of birthdays.
+Writes a CSV file with ROWS contacts and imports it into an empty database
+with the bulk import (one transaction, executemany in chunks), then once more
+to time the re-import where every row is skipped. The former import, one
+insert and commit per row, is timed on the first PER_ROW_ROWS rows and
+extrapolated.
+Run with `python3 -m benchmarks.csv_import`, add --update to store the
+result as baseline (see baselines.py). Exits with 1 on a regression.
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from birthday_push_message.database import (BirthdayStore, import_birthdays_from_csv,
+                                            read_csv_birthdays)
+from . import baselines
+
+ROWS = 100000
+PER_ROW_ROWS = 2000
+
+def write_csv(path, rows=ROWS):
+    """Write rows contacts, a tenth of them without year and a few twice."""
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write('Name;Day;Month;Year\n')
+        for number in range(rows):
+            if number % 50 == 49:
+                # a duplicate of an earlier row
+                number = rng.randrange(number)
+            year = '' if number % 10 == 0 else str(1930 + number % 90)
+            file.write(f'Person {number};{number % 28 + 1};{number % 12 + 1};{year}\n')
+
+def import_per_row(csv_path, db_path, rows=PER_ROW_ROWS):
+    """The former import: one connection, insert and commit per row."""
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as file:
+        for number, (name, date) in enumerate(read_csv_birthdays(file)):
+            if number == rows:
+                break
+            # OR IGNORE: the former table had no unique key
+            with sqlite3.connect(db_path) as connection:
+                connection.execute("INSERT OR IGNORE INTO birthdays (name, date) VALUES (?, ?)",
+                                   (name, date))
+            connection.close()
+
+def seconds(function):
+    """Return the wall time of one call in milliseconds and its result."""
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+def main():
+    """Run the benchmark and compare it with the baselines."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'birthdays.csv')
+        write_csv(csv_path)
+
+        per_row_path = os.path.join(tmp_dir, 'per_row.db')
+        BirthdayStore(per_row_path).close()
+        per_row, _ = seconds(lambda: import_per_row(csv_path, per_row_path))
+
+        db_path = os.path.join(tmp_dir, 'birthdays.db')
+        bulk, result = seconds(lambda: import_birthdays_from_csv(csv_path, db_path))
+        print(f"import: {result.inserted} inserted, {result.updated} updated, "
+              f"{result.skipped} skipped")
+        reimport, again = seconds(lambda: import_birthdays_from_csv(csv_path, db_path))
+        if again.inserted or again.updated or again.skipped != ROWS:
+            print(f"re-import changed the database: {again}")
+            sys.exit(1)
+
+    timings = {
+        'csv_import_per_row_extrapolated': per_row * ROWS / PER_ROW_ROWS,
+        'csv_import_bulk': bulk,
+        'csv_reimport_bulk': reimport,
+    }
+    print(f"{ROWS} rows: bulk import is "
+          f"{timings['csv_import_per_row_extrapolated'] / bulk:.0f}x faster than one commit per row")
+    if '--update' in sys.argv:
+        baselines.update_baselines(timings)
+    if baselines.check_baselines(timings):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+End-to-end latency benchmark of a display refresh.
+Replays a recorded Open-Meteo response (benchmarks/fixtures), generates a
+waste collection calendar and a birthday database and runs the refresh with
+the recording backend, so no network or panel is needed. Reports fetch,
+parse, render, pack and total timings of a cold refresh (one-shot script)
+and a warm one (daemon) and compares them with the stored baselines. Before
+every cold refresh the caches of the process and the ICS index on disk are
+dropped, so it starts like a new run of the script.
+Run with `python3 -m benchmarks.end_to_end`, add --update to store the result
+as baseline (see baselines.py) or --record to record a new response from the
+API for the location in e_paper/config.py. Exits with 1 on a regression.
+"""
+import contextlib
+import datetime
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+from PIL import Image, ImageDraw
+from abfallkalender import ics_index, read_abfall_ics, recurrence
+from birthday_push_message import database
+from e_paper import backends, config, icon_atlas
+from e_paper import display_to_epaper
+from meteo_data import open_meteo_data as omd
+from meteo_data.forecast_cache import ForecastCache
+from . import baselines
+from .ics_index import write_synthetic_calendar
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESPONSE_PATH = os.path.join(BASE_DIR, 'fixtures', 'open_meteo_forecast.bin')
+
+RUNS = 5
+BIRTHDAYS = 500
+# The refresh is shown for this hour of the recorded forecast
+HOUR_OF_FORECAST = 8
+
+class ReplayResponse:
+    """HTTP response with a recorded body."""
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        """Replayed responses never fail."""
+
+class ReplaySession:
+    """HTTP session which answers every request with the recorded response."""
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, url, **kwargs):
+        """Return the recorded response."""
+        return ReplayResponse(self.content)
+
+    def close(self):
+        """Nothing to close."""
+
+class RecordingSession:
+    """HTTP session which stores the body of every response it receives."""
+    def __init__(self, session, path):
+        self.session = session
+        self.path = path
+
+    def get(self, url, **kwargs):
+        """Send the request and store the response body."""
+        response = self.session.get(url, **kwargs)
+        response.raise_for_status()
+        with open(self.path, 'wb') as file:
+            file.write(response.content)
+        return response
+
+    def close(self):
+        """Close the wrapped session."""
+        self.session.close()
+
+def record_response(path=RESPONSE_PATH):
+    """Fetch the forecast for the configured location and store the raw response."""
+    import openmeteo_requests
+    import requests
+    client = openmeteo_requests.Client(session=RecordingSession(requests.Session(), path))
+    omd.fetch_forecast_blocks([(config.LATITUDE, config.LONGITUDE)], client)
+    print(f"Response recorded to {path}")
+
+def replay_client(content):
+    """Return an Open-Meteo client which replays a recorded response."""
+    import openmeteo_requests
+    return openmeteo_requests.Client(session=ReplaySession(content))
+
+def write_icons(folder, icon_names):
+    """Draw a simple BMP icon for every icon name."""
+    for name in icon_names:
+        image = Image.new('L', (100, 100), 255)
+        ImageDraw.Draw(image).ellipse((10, 10, 90, 90), fill=(sum(name.encode()) * 7) % 200)
+        image.save(os.path.join(folder, f'{name}.bmp'))
+
+def write_birthday_database(path, today, count=BIRTHDAYS):
+    """Create a birthday database with count entries, a few of them today."""
+    database.DB_PATH = path
+    store = database.get_store(path)
+    rng = random.Random(0)
+    with store.transaction():
+        for number in range(count):
+            day = today if number % 100 == 0 else today + datetime.timedelta(days=rng.randrange(365))
+            year = rng.randrange(1940, 2020)
+            store.add(f'Person {number}', f'{day.strftime("%d.%m")}.{year}')
+
+def drop_caches(ics_path, db_path):
+    """
+    Drop what a new process of the one-shot script wouldn't have: the loaded
+    ICS indexes and expanded rules, the birthday store, the time indexes of
+    the forecasts and the ICS index file.
+    """
+    read_abfall_ics._loaded_indexes.clear()
+    recurrence.occurrences_between.cache_clear()
+    database.get_store(db_path).close()
+    database._store.cache_clear()
+    omd._date_range.cache_clear()
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(ics_index.index_path_for(ics_path))
+
+def refresh(resources, now):
+    """Run one refresh with its output suppressed, returns the timings."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return display_to_epaper.display_weather_on_epaper(resources, now)
+
+def stage_timings(timings, prefix):
+    """Map the timings of a refresh to benchmark names in milliseconds."""
+    names = {'fetch': 'weather', 'parse_ics': 'waste calendar', 'birthdays': 'birthdays',
+             'render': 'render', 'pack': 'display', 'total': 'total'}
+    return {f'{prefix}_{name}': timings[stage] * 1000 for name, stage in names.items()}
+
+def main():
+    """Run the benchmark and compare it with the baselines."""
+    if '--record' in sys.argv:
+        record_response()
+        return
+
+    with open(RESPONSE_PATH, 'rb') as file:
+        content = file.read()
+    start = replay_client(content).weather_api(omd.FORECAST_URL, {})[0].Hourly().Time()
+    now = datetime.datetime.fromtimestamp(start, datetime.timezone.utc).replace(tzinfo=None)
+    now += datetime.timedelta(hours=HOUR_OF_FORECAST)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ics_path = os.path.join(tmp_dir, 'abfall.ics')
+        write_synthetic_calendar(ics_path, years=10, start_year=now.year - 5)
+        config.ICS_SOURCES = [ics_path]
+        db_path = os.path.join(tmp_dir, 'birthdays.db')
+        write_birthday_database(db_path, datetime.date.today())
+        write_icons(tmp_dir, set(omd.OpenMeteoWeather(0, 0).weather_icons.values()))
+        atlas_path = os.path.join(tmp_dir, 'icons.atlas')
+        icon_atlas.build_atlas(tmp_dir, atlas_path)
+
+        cold = []
+        warm = []
+        for run in range(RUNS):
+            # a fresh forecast cache, frame and tiles: the one-shot script
+            resources = display_to_epaper.DashboardResources(
+                backends.RecordingEPD(), os.path.join(tmp_dir, f'frame{run}.bin'))
+            resources.weather.openmeteo = replay_client(content)
+            resources.weather.cache = ForecastCache(os.path.join(tmp_dir, f'cache{run}'))
+            resources.atlas = icon_atlas.IconAtlas(atlas_path)
+            drop_caches(ics_path, db_path)
+            cold.append(stage_timings(refresh(resources, now), 'cold'))
+            # the same resources again: the daemon
+            warm.append(stage_timings(refresh(resources, now), 'warm'))
+            resources.close()
+
+    timings = {name: statistics.median(run[name] for run in cold) for name in cold[0]}
+    timings.update({name: statistics.median(run[name] for run in warm) for name in warm[0]})
+    if '--update' in sys.argv:
+        baselines.update_baselines(timings)
+    if baselines.check_baselines(timings):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
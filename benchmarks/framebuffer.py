@@ -0,0 +1,56 @@
+"""
+Microbenchmark of packing a rendered frame for the panel.
+Compares the vendor getbuffer() (convert, copy and invert every byte in
+Python, reproduced here so it runs without the driver) with the packed
+framebuffer path of e_paper/framebuffer.py.
+Run with `python3 -m benchmarks.framebuffer`, add --update to store the result
+as baseline (see baselines.py). Exits with 1 on a regression.
+"""
+import sys
+from PIL import Image, ImageDraw
+from e_paper.frame_diff import pack_frame
+from e_paper.framebuffer import FrameBuffer
+from . import baselines
+from .ics_index import timed
+
+WIDTH = 800
+HEIGHT = 480
+REPEAT = 20
+
+def vendor_getbuffer(image):
+    """getbuffer() of the Waveshare epd7in5_V2 driver."""
+    buf = bytearray(image.convert('1').tobytes('raw'))
+    for i in range(len(buf)):
+        buf[i] ^= 0xFF
+    return buf
+
+def sample_frame():
+    """A frame with some text and lines, like the dashboard."""
+    image = Image.new('1', (WIDTH, HEIGHT), 255)
+    draw = ImageDraw.Draw(image)
+    for row in range(0, HEIGHT, 40):
+        draw.line((0, row, WIDTH, row), fill=0)
+        draw.text((10, row + 10), f'Row {row} ' * 8, fill=0)
+    return image
+
+def main():
+    """Run the benchmark and compare it with the baselines."""
+    image = sample_frame()
+    framebuffer = FrameBuffer(WIDTH, HEIGHT)
+    if framebuffer.pack(pack_frame(image)) != vendor_getbuffer(image):
+        print("packed framebuffer differs from getbuffer()")
+        sys.exit(1)
+
+    timings = {
+        'framebuffer_getbuffer': timed(lambda: vendor_getbuffer(image), REPEAT),
+        'framebuffer_packed': timed(lambda: framebuffer.pack(pack_frame(image)), REPEAT),
+    }
+    print(f"packed framebuffer is {timings['framebuffer_getbuffer'] / timings['framebuffer_packed']:.0f}x "
+          "faster than getbuffer()")
+    if '--update' in sys.argv:
+        baselines.update_baselines(timings)
+    if baselines.check_baselines(timings):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark for reading waste collection ICS files.
+Generates a multi-year waste collection calendar with thousands of VEVENTs and
+compares a full icalendar parse with the streaming scanner and a lookup in
+the compiled index.
+Run with `python3 -m benchmarks.ics_index`.
+"""
+import datetime
+import os
+import tempfile
+import time
+import tracemalloc
+from abfallkalender import read_abfall_ics, ics_index
+
+WASTE_TYPES = ["Papier", "Restmüll", "Biomüll", "Gelber Sack"]
+
+def write_synthetic_calendar(file_path, years=10, start_year=2020):
+    """Write an ICS file with one pickup per waste type every few days."""
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//benchmark//abfallkalender//DE"]
+    day = datetime.date(start_year, 1, 1)
+    end = datetime.date(start_year + years, 1, 1)
+    uid = 0
+    while day < end:
+        for offset, waste_type in enumerate(WASTE_TYPES):
+            pickup = day + datetime.timedelta(days=offset)
+            uid += 1
+            lines += ["BEGIN:VEVENT",
+                      f"UID:{uid}@benchmark",
+                      f"DTSTAMP:{start_year}0101T000000Z",
+                      f"DTSTART;VALUE=DATE:{pickup.strftime('%Y%m%d')}",
+                      f"DTEND;VALUE=DATE:{(pickup + datetime.timedelta(days=1)).strftime('%Y%m%d')}",
+                      f"SUMMARY:{waste_type} Abfuhr",
+                      "END:VEVENT"]
+        day += datetime.timedelta(days=7)
+    lines.append("END:VCALENDAR")
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write("\r\n".join(lines) + "\r\n")
+    return uid
+
+def write_recurring_calendar(file_path, years=10, start_year=2020):
+    """
+    Write an ICS file with one biweekly RRULE per waste type, with every
+    tenth pickup moved away by an EXDATE.
+    """
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//benchmark//abfallkalender//DE"]
+    for offset, waste_type in enumerate(WASTE_TYPES):
+        first = datetime.date(start_year, 1, 1) + datetime.timedelta(days=offset)
+        exdates = [(first + datetime.timedelta(weeks=2 * n)).strftime('%Y%m%d')
+                   for n in range(10, years * 26, 10)]
+        lines += ["BEGIN:VEVENT",
+                  f"UID:rrule-{offset}@benchmark",
+                  f"DTSTAMP:{start_year}0101T000000Z",
+                  f"DTSTART;VALUE=DATE:{first.strftime('%Y%m%d')}",
+                  f"DTEND;VALUE=DATE:{(first + datetime.timedelta(days=1)).strftime('%Y%m%d')}",
+                  f"RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL={start_year + years}0101",
+                  f"EXDATE;VALUE=DATE:{','.join(exdates)}",
+                  f"SUMMARY:{waste_type} Abfuhr",
+                  "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write("\r\n".join(lines) + "\r\n")
+
+def timed(function, repeat):
+    """Return the mean wall time of a function in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def peak_memory(function):
+    """Return the peak memory allocated by a function in kB."""
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+def icalendar_parse(ics_file_path):
+    """Parse the calendar into a full icalendar tree, as the module used to do."""
+    from icalendar import Calendar
+    with open(ics_file_path, 'r', encoding='utf-8') as file:
+        calendar = Calendar.from_ical(file.read())
+    return [component for component in calendar.walk() if component.name == "VEVENT"]
+
+def main():
+    """Run the benchmark and print the results."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ics_file_path = os.path.join(tmp_dir, 'abfallkalender.ics')
+        count = write_synthetic_calendar(ics_file_path)
+        today = datetime.date.today()
+        tomorrow = today + datetime.timedelta(days=1)
+
+        week = today + datetime.timedelta(days=7)
+
+        full_parse = timed(lambda: icalendar_parse(ics_file_path), 3)
+        scan = timed(lambda: read_abfall_ics.parse_events(ics_file_path), 3)
+        window = timed(lambda: read_abfall_ics.get_events_between(ics_file_path, today, week), 3)
+        build = timed(lambda: read_abfall_ics.load_index(ics_file_path), 1)
+        lookup = timed(lambda: ics_index.events_between(
+            read_abfall_ics.load_index(ics_file_path), today, tomorrow), 50)
+
+        print(f"{count} VEVENTs, {os.path.getsize(ics_file_path) / 1024:.0f} kB ICS")
+        print(f"full icalendar parse: {full_parse:8.2f} ms "
+              f"{peak_memory(lambda: icalendar_parse(ics_file_path)):8.0f} kB peak")
+        print(f"streaming scan:       {scan:8.2f} ms "
+              f"{peak_memory(lambda: read_abfall_ics.parse_events(ics_file_path)):8.0f} kB peak")
+        week_query = lambda: read_abfall_ics.get_events_between(ics_file_path, today, week)
+        print(f"streaming week query: {window:8.2f} ms "
+              f"{peak_memory(week_query):8.0f} kB peak")
+        print(f"index build (once):   {build:8.2f} ms")
+        print(f"indexed lookup:       {lookup:8.2f} ms")
+
+        recurring_path = os.path.join(tmp_dir, 'recurring.ics')
+        write_recurring_calendar(recurring_path)
+        index = read_abfall_ics.load_index(recurring_path)
+        cold = timed(lambda: ics_index.events_between(index, today, week), 1)
+        cached = timed(lambda: ics_index.events_between(index, today, week), 50)
+        print(f"RRULE week expansion: {cold:8.2f} ms")
+        print(f"RRULE cached window:  {cached:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
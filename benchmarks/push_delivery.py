@@ -0,0 +1,71 @@
+"""
+Benchmark of the birthday push delivery against the local stub of the
+Pushbullet API (birthday_push_message/pushbullet_stub.py), so no account or
+network is needed. The stub answers after LATENCY seconds like a remote
+server. Compares the former delivery (a new client, which loads the account
+data, and one push after the other per message) with the PushNotifier
+sending concurrently over one client and with a single digest push.
+tests/test_push_notification.py checks that the pushes arrive.
+Run with `python3 -m benchmarks.push_delivery`, add --update to store the
+result as baseline (see baselines.py). Exits with 1 on a regression.
+"""
+import sys
+import time
+from birthday_push_message.push_notification import PushNotifier
+from birthday_push_message.pushbullet_stub import start_stub, stub_client_class
+from . import baselines
+
+MESSAGES = 8
+REPEAT = 3
+# Seconds the stub takes for a response
+LATENCY = 0.05
+
+def send_per_message(client_class, messages):
+    """The former delivery: a new client for every push, one after the other."""
+    for message in messages:
+        client_class('key').push_note("Birthday Reminder", message)
+
+def measure(server, function):
+    """Return the mean wall time of a delivery in milliseconds and the requests per run."""
+    server.requests = 0
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        function()
+    return (time.perf_counter() - start) / REPEAT * 1000, server.requests / REPEAT
+
+def main():
+    """Run the benchmark and compare it with the baselines."""
+    server = start_stub(LATENCY)
+    client_class = stub_client_class(server)
+    messages = [f"Today is Person {number}'s {20 + number}th birthday!"
+                for number in range(MESSAGES)]
+
+    def concurrent():
+        notifier = PushNotifier('key', client=client_class('key'))
+        notifier.send_all([("Birthday Reminder", message) for message in messages])
+        notifier.close()
+
+    def digest():
+        PushNotifier('key', client=client_class('key')).send_digest("Birthday Reminder", messages)
+
+    per_message, per_message_requests = measure(server, lambda: send_per_message(client_class,
+                                                                                 messages))
+    concurrent_time, concurrent_requests = measure(server, concurrent)
+    digest_time, digest_requests = measure(server, digest)
+    server.shutdown()
+
+    print(f"{MESSAGES} messages, {LATENCY * 1000:.0f} ms per request: "
+          f"{per_message_requests:.0f} requests one by one, {concurrent_requests:.0f} "
+          f"concurrent, {digest_requests:.0f} as digest")
+    timings = {
+        'push_per_message': per_message,
+        'push_concurrent': concurrent_time,
+        'push_digest': digest_time,
+    }
+    if '--update' in sys.argv:
+        baselines.update_baselines(timings)
+    if baselines.check_baselines(timings):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
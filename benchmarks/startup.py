@@ -0,0 +1,58 @@
+"""
+Cold start benchmark of the e-paper data path.
+Starts fresh interpreters which import the modules a refresh needs, reports
+the import time and checks that the heavy modules (pandas, HTTP clients,
+pushbullet, the panel driver) are only imported lazily.
+Run with `python3 -m benchmarks.startup`, add --update to store the result
+as baseline (see baselines.py). Exits with 1 on a regression.
+"""
+import json
+import statistics
+import subprocess
+import sys
+from . import baselines
+
+# Modules imported by a display refresh
+MODULES = ['meteo_data.open_meteo_data', 'abfallkalender.agenda',
+           'birthday_push_message.scheduler', 'e_paper.icon_atlas',
+           'e_paper.display_to_epaper']
+
+# Modules which must not be imported at start-up
+HEAVY_MODULES = ['pandas', 'requests_cache', 'openmeteo_requests', 'requests', 'pushbullet',
+                 'epaper']
+
+RUNS = 5
+
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'ms': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+def measure():
+    """Import the modules in a fresh interpreter, returns (milliseconds, heavy modules)."""
+    code = MEASURE.format(modules=MODULES, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['ms'], result['heavy']
+
+def main():
+    """Run the benchmark and compare it with the baseline."""
+    results = [measure() for _ in range(RUNS)]
+    timings = {'startup_imports': statistics.median(ms for ms, _ in results)}
+    heavy = sorted({module for _, modules in results for module in modules})
+
+    if '--update' in sys.argv:
+        baselines.update_baselines(timings)
+    regressions = baselines.check_baselines(timings)
+    if heavy:
+        print(f"heavy modules imported at start-up: {', '.join(heavy)}")
+    if regressions or heavy:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
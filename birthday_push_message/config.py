@@ -5,3 +5,7 @@ Configuration file for storing global constants.
 
 # Replace 'your_pushbullet_api_key' with your actual Pushbullet API key
 API_KEY = "your_pushbullet_api_key"
+
+# Several birthdays on one day are sent as one push each (False) or as one
+# combined push (True)
+DIGEST = False
@@ -1,131 +1,385 @@
 """
 Module for managing a SQLite database of birthdays.
-This module provides functions to initialize the database, add, 
-edit, delete, and fetch birthday records.
+This module provides the BirthdayStore, which keeps one connection to the
+database, and functions to initialize the database, add, edit, delete, and
+fetch birthday records through the shared store.
 """
+import collections
+import contextlib
+import functools
+import itertools
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 import csv
 import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "birthdays.db")
 
-def initialize_database():
-    """Initialize the SQLite database and create the birthdays table if it doesn't exist."""
-    connection = sqlite3.connect(DB_PATH)
-    cursor = connection.cursor()
-    cursor.execute(
+# Prepared statements kept by each connection, see sqlite3.connect
+CACHED_STATEMENTS = 32
+
+# Version of the schema, stored in PRAGMA user_version (see BirthdayStore._migrate)
+SCHEMA_VERSION = 3
+
+# The unknown year of dates like 01.02.0999
+UNKNOWN_YEAR = 999
+
+# Rows written per executemany call of an import
+IMPORT_CHUNK_SIZE = 1000
+
+# A row of the birthdays table, age is None if the year is unknown
+Birthday = collections.namedtuple('Birthday', ['id', 'name', 'date', 'age'])
+
+# Counts of an import, see BirthdayStore.import_birthdays
+ImportResult = collections.namedtuple('ImportResult', ['inserted', 'updated', 'skipped'])
+
+# Day, month and year of the dd.mm.yyyy date are kept as integers, so
+# birthdays on a date are found with the index instead of a scan of all dates
+CREATE_TABLE = """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        month INTEGER,
+        day INTEGER,
+        year INTEGER
+    )
+"""
+CREATE_INDEX = "CREATE INDEX birthdays_month_day ON birthdays (month, day)"
+# A name is stored once per date
+CREATE_UNIQUE_INDEX = "CREATE UNIQUE INDEX birthdays_name_date ON birthdays (name, date)"
+# Age on the date :year-:month-:day, derived when read
+AGE = (f"CASE WHEN year IS NULL OR year = {UNKNOWN_YEAR} THEN NULL"
+       " ELSE :year - year - ((month, day) > (:month, :day)) END")
+SELECT_ALL = f"SELECT id, name, date, {AGE} FROM birthdays"
+# The (month, day) index answers both, see EXPLAIN QUERY PLAN
+SELECT_ON_DAY = SELECT_ALL + " WHERE month = :month AND day = :day"
+SELECT_BETWEEN_DAYS = (SELECT_ALL + " WHERE (month, day) BETWEEN (:first_month, :first_day)"
+                       " AND (:last_month, :last_day) ORDER BY month, day")
+INSERT = ("INSERT INTO birthdays (name, date, month, day, year) VALUES (?, ?, ?, ?, ?)"
+          " ON CONFLICT (name, date) DO NOTHING")
+# OR IGNORE: no change if the new name and date are already stored
+UPDATE = ("UPDATE OR IGNORE birthdays SET name = ?, date = ?, month = ?, day = ?, year = ?"
+          " WHERE id = ?")
+# An import completes the year of a birthday stored with the unknown year and
+# skips dates with the unknown year if the birthday is stored with a year. The
+# lookups go by name, the (month, day) index would visit every birthday on the day
+IMPORT = ("INSERT INTO birthdays (name, date, month, day, year)"
+          " VALUES (:name, :date, :month, :day, :year) ON CONFLICT (name, date) DO NOTHING")
+IMPORT_COMPLETE_YEAR = ("UPDATE OR IGNORE birthdays INDEXED BY birthdays_name_date"
+                        " SET date = :date, year = :year"
+                        " WHERE name = :name AND month = :month AND day = :day"
+                        f" AND year = {UNKNOWN_YEAR}")
+IMPORT_UNKNOWN_YEAR = ("INSERT INTO birthdays (name, date, month, day, year)"
+                       " SELECT :name, :date, :month, :day, :year WHERE NOT EXISTS"
+                       " (SELECT 1 FROM birthdays INDEXED BY birthdays_name_date"
+                       " WHERE name = :name AND month = :month AND day = :day)")
+DELETE = "DELETE FROM birthdays WHERE id = ?"
+DELETE_BY_NAME_AND_DATE = "DELETE FROM birthdays WHERE name = ? AND date = ?"
+
+def date_parts(date):
+    """
+    Return (month, day, year) of a dd.mm.yyyy date as integers, the unknown
+    year 0999 is 999. All are None if the date can't be parsed.
+    """
+    try:
+        day, month, year = (int(part) for part in date.split('.'))
+    except (AttributeError, ValueError):
+        return None, None, None
+    return month, day, year
+
+def read_csv_birthdays(file):
+    """
+    Yield (name, date) of the rows of a CSV file with the columns Name, Day,
+    Month and Year (may be empty), separated by semicolons. The file is read
+    row by row. Rows without name or with an invalid date are yielded with the
+    date None. Raises KeyError if a column is missing.
+    """
+    reader = csv.DictReader(file, delimiter=';')
+    missing = {'Name', 'Day', 'Month', 'Year'} - set(reader.fieldnames or ())
+    if missing:
+        raise KeyError(', '.join(sorted(missing)))
+    for row in reader:
+        name = (row['Name'] or '').strip()
+        date = f"{(row['Day'] or '').strip().zfill(2)}.{(row['Month'] or '').strip().zfill(2)}." \
+               f"{(row['Year'] or '').strip() or '0999'}"
+        month, day, year = date_parts(date)
+        if not name or year is None or not (1 <= month <= 12 and 1 <= day <= 31):
+            date = None
+        yield name, date
+
+def _on(date, **parameters):
+    """Query parameters of the age on a date."""
+    return dict(parameters, year=date.year, month=date.month, day=date.day)
+
+class BirthdayStore:
+    """
+    The birthday database behind one long-lived connection.
+    The SQL of every query is a constant, so sqlite3 prepares it once and takes
+    it from the statement cache of the connection afterwards. Writes run in
+    explicit transactions (see transaction()), several writes in one
+    transaction cost a single commit. Rows are returned as Birthday tuples,
+    ages are derived from the birth year when read, so reading never writes.
+    The table is created if it doesn't exist and migrated to the current schema.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DB_PATH
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._connection = None
+        self._pid = None
+        # immediate: a second process waits instead of migrating at the same time
+        with self.transaction(immediate=True) as connection:
+            self._migrate(connection)
+
+    @staticmethod
+    def _migrate(connection):
+        """Create the table or bring its schema up to SCHEMA_VERSION."""
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table'"
+                              " AND name = 'birthdays'").fetchone() is None:
+            connection.execute(CREATE_TABLE.format(table='birthdays'))
+            connection.execute(CREATE_INDEX)
+            connection.execute(CREATE_UNIQUE_INDEX)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            return
+
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # integer month, day and year columns with an index
+            for column in ('month', 'day', 'year'):
+                connection.execute(f"ALTER TABLE birthdays ADD COLUMN {column} INTEGER")
+            connection.executemany(
+                "UPDATE birthdays SET month = ?, day = ?, year = ? WHERE id = ?",
+                [date_parts(date) + (record_id,)
+                 for record_id, date in connection.execute("SELECT id, date FROM birthdays")])
+            connection.execute(CREATE_INDEX)
+        if version < 2:
+            # the stored age is dropped, it is derived when read. The table is
+            # copied as older SQLite versions can't drop columns
+            connection.execute(CREATE_TABLE.format(table='birthdays_v2'))
+            connection.execute("INSERT INTO birthdays_v2 (id, name, date, month, day, year)"
+                               " SELECT id, name, date, month, day, year FROM birthdays")
+            # keep the ids of deleted rows from being used again
+            connection.execute("UPDATE sqlite_sequence SET seq = (SELECT max(seq)"
+                               " FROM sqlite_sequence WHERE name IN ('birthdays', 'birthdays_v2'))"
+                               " WHERE name = 'birthdays_v2'")
+            connection.execute("DROP TABLE birthdays")
+            connection.execute("ALTER TABLE birthdays_v2 RENAME TO birthdays")
+            connection.execute(CREATE_INDEX)
+        if version < 3:
+            # duplicates of earlier imports are removed, the first one is kept
+            connection.execute("DELETE FROM birthdays WHERE id NOT IN"
+                               " (SELECT min(id) FROM birthdays GROUP BY name, date)")
+            connection.execute(CREATE_UNIQUE_INDEX)
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self):
+        """Return the connection, it is opened again in a forked process."""
+        if self._connection is None or self._pid != os.getpid():
+            # autocommit mode, transactions are started explicitly
+            self._connection = sqlite3.connect(self.db_path, isolation_level=None,
+                                               check_same_thread=False,
+                                               cached_statements=CACHED_STATEMENTS)
+            self._pid = os.getpid()
+        return self._connection
+
+    @contextlib.contextmanager
+    def transaction(self, immediate=False):
         """
-        CREATE TABLE IF NOT EXISTS birthdays (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            date TEXT NOT NULL,
-            age INTEGER NOT NULL
-        )
+        Context manager running the statements of its block in one transaction,
+        committed at the end or rolled back on an error. Transactions can be nested,
+        only the outermost one commits. immediate takes the write lock right away.
+        Yields the connection.
         """
-    )
-    connection.commit()
-    connection.close()
+        with self._lock:
+            connection = self._connect()
+            if self._depth == 0:
+                connection.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            self._depth += 1
+            try:
+                yield connection
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    connection.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                connection.execute("COMMIT")
+
+    def all(self, today=None):
+        """Return all birthdays with the ages on today (default: the current date)."""
+        with self._lock:
+            return [Birthday._make(row)
+                    for row in self._connect().execute(SELECT_ALL, _on(today or datetime.now()))]
+
+    def on_date(self, date):
+        """Return the birthdays on the day and month of a date, with the ages reached on it."""
+        with self._lock:
+            return [Birthday._make(row)
+                    for row in self._connect().execute(SELECT_ON_DAY, _on(date))]
 
-def add_birthday(name, date, age):
-    """Add a new birthday record to the database."""
+    def upcoming(self, days, start=None):
+        """
+        Return the birthdays from start (default: today) up to days days later,
+        sorted by date, with the ages reached on them. The range may wrap across
+        the end of the year.
+        """
+        start = start or datetime.now()
+        # at most one year, a wider range would match some days twice
+        end = start + timedelta(days=min(days, 364))
+        ranges = [((start.month, start.day), (end.month, end.day), start.year)]
+        if ranges[0][0] > ranges[0][1]:
+            ranges = [((start.month, start.day), (12, 31), start.year),
+                      ((1, 1), (end.month, end.day), end.year)]
+        rows = []
+        with self._lock:
+            connection = self._connect()
+            for (first_month, first_day), (last_month, last_day), year in ranges:
+                # the age on the last day of the year is the one reached on the birthday
+                rows += connection.execute(SELECT_BETWEEN_DAYS, _on(
+                    datetime(year, 12, 31), first_month=first_month, first_day=first_day,
+                    last_month=last_month, last_day=last_day)).fetchall()
+        return [Birthday._make(row) for row in rows]
+
+    def add(self, name, date):
+        """Add a birthday, returns its id or None if it is already stored."""
+        with self.transaction() as connection:
+            cursor = connection.execute(INSERT, (name, date) + date_parts(date))
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def edit(self, record_id, name, date):
+        """Change a birthday, returns False if the new name and date are already stored."""
+        with self.transaction() as connection:
+            return connection.execute(
+                UPDATE, (name, date) + date_parts(date) + (record_id,)).rowcount > 0
+
+    def import_birthdays(self, birthdays, chunk_size=IMPORT_CHUNK_SIZE):
+        """
+        Import an iterable of (name, date), e.g. from read_csv_birthdays, in
+        one transaction. It is consumed in chunks of chunk_size, each written
+        with a few executemany calls. Birthdays already stored are skipped, a
+        stored one with the unknown year gets the year of the imported date
+        (updated) and one with the unknown year is skipped if the birthday is
+        stored with its year. Entries with the date None are skipped.
+        Returns an ImportResult.
+        """
+        inserted = updated = skipped = 0
+        birthdays = iter(birthdays)
+        with self.transaction(immediate=True) as connection:
+            while True:
+                chunk = list(itertools.islice(birthdays, chunk_size))
+                if not chunk:
+                    break
+                rows = [dict(zip(('month', 'day', 'year'), date_parts(date)), name=name, date=date)
+                        for name, date in chunk if date]
+                known = [row for row in rows if row['year'] != UNKNOWN_YEAR]
+                unknown = [row for row in rows if row['year'] == UNKNOWN_YEAR]
+                chunk_updated = chunk_inserted = 0
+                if known:
+                    chunk_updated = connection.executemany(IMPORT_COMPLETE_YEAR, known).rowcount
+                    # the completed rows conflict now and are not inserted
+                    chunk_inserted = connection.executemany(IMPORT, known).rowcount
+                if unknown:
+                    # after the known years, so the order of the rows doesn't matter
+                    chunk_inserted += connection.executemany(IMPORT_UNKNOWN_YEAR, unknown).rowcount
+                updated += chunk_updated
+                inserted += chunk_inserted
+                skipped += len(chunk) - chunk_inserted - chunk_updated
+        return ImportResult(inserted, updated, skipped)
+
+    def delete(self, record_id):
+        """Delete a birthday by id."""
+        with self.transaction() as connection:
+            connection.execute(DELETE, (record_id,))
+
+    def delete_by_name_and_date(self, name, date):
+        """Delete a birthday by name and date."""
+        with self.transaction() as connection:
+            connection.execute(DELETE_BY_NAME_AND_DATE, (name, date))
+
+    def close(self):
+        """Close the connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+@functools.lru_cache(maxsize=None)
+def _store(db_path):
+    return BirthdayStore(db_path)
+
+def get_store(db_path=None):
+    """Return the shared BirthdayStore of a database (default: DB_PATH), it is opened on first use."""
+    return _store(db_path or DB_PATH)
+
+def initialize_database(db_path=None):
+    """Initialize the SQLite database and create the birthdays table if it doesn't exist."""
+    try:
+        get_store(db_path)
+    except sqlite3.Error as e:
+        print(f"Error initializing the database: {e}")
+
+def add_birthday(name, date, age=None):
+    """
+    Add a new birthday record to the database.
+    age is ignored, ages are derived from the date when read.
+    """
     try:
-        connection = sqlite3.connect(DB_PATH)
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO birthdays (name, date, age) VALUES (?, ?, ?)",
-            (name, date, age)
-        )
-        connection.commit()
+        get_store().add(name, date)
     except sqlite3.Error as e:
         print(f"Error adding birthday: {e}")
-    finally:
-        connection.close()
 
-def edit_birthday(record_id, name, date, age):
-    """Edit an existing birthday record in the database."""
+def edit_birthday(record_id, name, date, age=None):
+    """
+    Edit an existing birthday record in the database.
+    age is ignored, ages are derived from the date when read.
+    """
     try:
-        connection = sqlite3.connect(DB_PATH)
-        cursor = connection.cursor()
-        cursor.execute(
-            "UPDATE birthdays SET name = ?, date = ?, age = ? WHERE id = ?",
-            (name, date, age, record_id)
-        )
-        connection.commit()
+        get_store().edit(record_id, name, date)
     except sqlite3.Error as e:
         print(f"Error editing birthday: {e}")
-    finally:
-        connection.close()
 
 def delete_birthday(record_id):
     """Delete a birthday record from the database."""
     try:
-        connection = sqlite3.connect(DB_PATH)
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM birthdays WHERE id = ?", (record_id,))
-        connection.commit()
+        get_store().delete(record_id)
     except sqlite3.Error as e:
         print(f"Error deleting birthday: {e}")
-    finally:
-        connection.close()
 
 def delete_birthday_v2(name, date):
     """Delete a birthday record from the database by name and date."""
     try:
-        connection = sqlite3.connect(DB_PATH)
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM birthdays WHERE name = ? AND date = ?", (name, date))
-        connection.commit()
+        get_store().delete_by_name_and_date(name, date)
     except sqlite3.Error as e:
         print(f"Error deleting birthday: {e}")
-    finally:
-        connection.close()
 
-def get_birthdays():
-    """Fetch all birthday records from the database."""
+def get_birthdays(db_path=None):
+    """Fetch all birthday records from the database (default: DB_PATH) as Birthday tuples."""
     try:
-        connection = sqlite3.connect(DB_PATH)
-        cursor = connection.cursor()
-        cursor.execute("SELECT * FROM birthdays")
-        return cursor.fetchall()
+        return get_store(db_path).all()
     except sqlite3.Error as e:
         print(f"Error fetching birthdays: {e}")
         return []
-    finally:
-        connection.close()
 
-def import_birthdays_from_csv(file_path):
-    """Read birthdays from a CSV file and add them to the database."""
+def import_birthdays_from_csv(file_path, db_path=None):
+    """
+    Import the birthdays of a CSV file (see read_csv_birthdays) into the
+    database in one transaction. Returns an ImportResult, None on an error.
+    """
     try:
-        with open(file_path, mode='r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=';')
-            for row in reader:
-                day = row['Day'].zfill(2)
-                month = row['Month'].zfill(2)
-                year = row['Year'] if row['Year'] else '0999'
-                name = row['Name']
-                date = f"{day}.{month}.{year}"
-                age = -1 if year == '0999' else datetime.now().year - int(year)
-                add_birthday(name, date, age)
-    except (FileNotFoundError, KeyError) as e:
+        with open(file_path, mode='r', encoding='utf-8-sig', newline='') as csvfile:
+            return get_store(db_path).import_birthdays(read_csv_birthdays(csvfile))
+    except (OSError, KeyError) as e:
         print(f"Error reading CSV file: {e}")
-
-def update_age_if_birthday():
-    """Update the age of persons in the database if today is their birthday."""
-    try:
-        connection = sqlite3.connect(DB_PATH)
-        cursor = connection.cursor()
-        today = datetime.now().strftime("%d.%m")
-        cursor.execute("SELECT id, date FROM birthdays")
-        records = cursor.fetchall()
-        for record_id, date in records:
-            day_month, year = date[:5], date[6:]
-            if day_month == today:
-                new_age = -1 if year == '0999' else datetime.now().year - int(year)
-                cursor.execute("UPDATE birthdays SET age = ? WHERE id = ?", (new_age, record_id))
-        connection.commit()
     except sqlite3.Error as e:
-        print(f"Error updating ages: {e}")
-    finally:
-        connection.close()
+        print(f"Error importing birthdays: {e}")
+    return None
+
+def update_age_if_birthday(db_path=None):
+    """
+    Kept for existing callers and cron jobs, there is nothing to update:
+    ages are derived from the birth year when read.
+    """
@@ -7,17 +7,18 @@ import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
 from datetime import datetime
-from .database import add_birthday, edit_birthday, delete_birthday, get_birthdays
-from .push_notification import send_push_message
+from .database import get_store
+from .scheduler import birthday_message, send_birthday_messages
 from .config import API_KEY
 
 def refresh_table(tree):
     """Refresh the table with the current database records."""
     for row in tree.get_children():
         tree.delete(row)
-    for record in sorted(get_birthdays(), key=lambda x: (int(x[2].split('.')[1]),
-                                                          int(x[2].split('.')[0]))):
-        tree.insert("", "end", values=record)
+    for record in sorted(get_store().all(), key=lambda x: (int(x.date.split('.')[1]),
+                                                            int(x.date.split('.')[0]))):
+        # the age is derived from the birth year, unknown years are shown empty
+        tree.insert("", "end", values=record._replace(age='' if record.age is None else record.age))
     style_rows(tree)
 
 # Apply alternating row colors
@@ -43,19 +44,21 @@ def validate_date_format(date):
 def refresh_listbox(listbox):
     """Refresh the listbox with the current database records."""
     listbox.delete(0, tk.END)
-    for record in get_birthdays():
-        listbox.insert(tk.END, f"{record[0]}: {record[1]} - {record[2]} ({record[3]} years old)")
+    for record in get_store().all():
+        age = 'unknown' if record.age is None else record.age
+        listbox.insert(tk.END, f"{record.id}: {record.name} - {record.date} ({age} years old)")
 
-def add_record(name_entry, date_entry, age_entry, tree):
+def add_record(name_entry, date_entry, tree):
     """Add a new record to the database."""
     name = name_entry.get()
     date = date_entry.get()
-    age = age_entry.get()
     if not validate_date_format(date):
         messagebox.showerror("Error", "Date must be in the format dd.mm.yyyy!")
         return
-    if name and date and age:
-        add_birthday(name, date, int(age))
+    if name and date:
+        if get_store().add(name, date) is None:
+            messagebox.showerror("Error", "This birthday is already stored!")
+            return
         refresh_table(tree)
         messagebox.showinfo("Success", "Record added successfully!")
     else:
@@ -64,7 +67,7 @@ def add_record(name_entry, date_entry, age_entry, tree):
 # Global variable to track the previous selection
 PREVIOUS_SELECTION = None
 
-def on_record_select(name_entry, date_entry, age_entry, tree):
+def on_record_select(name_entry, date_entry, tree):
     """Handle record selection in the treeview."""
     global PREVIOUS_SELECTION
 
@@ -93,10 +96,7 @@ def on_record_select(name_entry, date_entry, age_entry, tree):
         date_entry.delete(0, tk.END)
         date_entry.insert(0, date)
 
-        age_entry.delete(0, tk.END)
-        age_entry.insert(0, age)
-
-def edit_record(name_entry, date_entry, age_entry, tree):
+def edit_record(name_entry, date_entry, tree):
     """Edit the selected record in the database."""
     try:
         selected_item = tree.selection()
@@ -108,14 +108,15 @@ def edit_record(name_entry, date_entry, age_entry, tree):
         record_id = tree.item(selected_item, "values")[0]
         name = name_entry.get()
         date = date_entry.get()
-        age = age_entry.get()
 
         if not validate_date_format(date):
             messagebox.showerror("Error", "Date must be in the format dd.mm.yyyy!")
             return
 
-        if name and date and age:
-            edit_birthday(record_id, name, date, int(age))
+        if name and date:
+            if not get_store().edit(record_id, name, date):
+                messagebox.showerror("Error", "This birthday is already stored!")
+                return
             refresh_table(tree)
             messagebox.showinfo("Success", "Record updated successfully!")
         else:
@@ -129,7 +130,7 @@ def delete_record(tree):
     try:
         selected_item = tree.selection()[0]  # Get selected item
         record_id = tree.item(selected_item, "values")[0]
-        delete_birthday(record_id)
+        get_store().delete(record_id)
         refresh_table(tree)
         messagebox.showinfo("Success", "Record deleted successfully!")
     except IndexError:
@@ -138,17 +139,12 @@ def delete_record(tree):
 
 def notify_now(api_key):
     """Send a push message immediately if there is a birthday today."""
-    today = datetime.now().strftime("%d.%m.")  # Only day and month are needed
-    birthdays = get_birthdays()
-    found = False
-    for birthday in birthdays:
-        name, date, age = birthday[1], birthday[2], birthday[3]
-        # Extract day and month from the stored date
-        stored_day_month = ".".join(date.split(".")[:2]) + "."
-        if stored_day_month == today:  # Compare only day and month
-            send_push_message(api_key, "Birthday Reminder", f"Today is {name}'s {age}th birthday!")
-            found = True
-    if not found:
+    # Only day and month are compared, with the index of the store
+    birthdays = get_store().on_date(datetime.now())
+    if birthdays:
+        send_birthday_messages(api_key, [birthday_message(birthday.name, birthday.age)
+                                         for birthday in birthdays])
+    else:
         messagebox.showinfo("Notification", "No birthdays today.")
 
 def open_edit_window(tree):
@@ -156,7 +152,7 @@ def open_edit_window(tree):
     try:
         selected_item = tree.selection()[0]  # Get selected item
         values = tree.item(selected_item, "values")
-        record_id, current_name, current_date, current_age = values
+        record_id, current_name, current_date, _ = values
 
         # Create a new window
         edit_window = tk.Toplevel()
@@ -174,24 +170,19 @@ def open_edit_window(tree):
         date_entry.grid(row=1, column=1, sticky="ew")
         date_entry.insert(0, current_date)
 
-        # Age field
-        tk.Label(edit_window, text="Age:").grid(row=2, column=0, sticky="w")
-        age_entry = tk.Entry(edit_window)
-        age_entry.grid(row=2, column=1, sticky="ew")
-        age_entry.insert(0, current_age)
-
         def save_changes():
             """Save the updated data to the database."""
             updated_name = name_entry.get()
             updated_date = date_entry.get()
-            updated_age = age_entry.get()
 
             if not validate_date_format(updated_date):
                 messagebox.showerror("Error", "Date must be in the format dd.mm.yyyy!")
                 return
 
-            if updated_name and updated_date and updated_age:
-                edit_birthday(record_id, updated_name, updated_date, int(updated_age))
+            if updated_name and updated_date:
+                if not get_store().edit(record_id, updated_name, updated_date):
+                    messagebox.showerror("Error", "This birthday is already stored!")
+                    return
                 refresh_table(tree)
                 edit_window.destroy()
                 messagebox.showinfo("Success", "Record updated successfully!")
@@ -225,10 +216,6 @@ def create_gui():
     date_entry = tk.Entry(root)
     date_entry.grid(row=1, column=1, sticky="ew")
 
-    tk.Label(root, text="Age:").grid(row=2, column=0, sticky="w")
-    age_entry = tk.Entry(root)
-    age_entry.grid(row=2, column=1, sticky="ew")
-
     # Table view
     columns = ("ID", "Name", "Date", "Age")
     tree = ttk.Treeview(root, columns=columns, show="headings")
@@ -257,13 +244,13 @@ def create_gui():
 
     # Bind the selection event to update input fields
     tree.bind("<<TreeviewSelect>>", lambda event: on_record_select(name_entry,
-                                                                   date_entry, age_entry, tree))
+                                                                   date_entry, tree))
 
     # Buttons
     tk.Button(root, text="Add", command=lambda: add_record(name_entry, date_entry,
-                                                           age_entry, tree)).grid(row=4, column=0)
+                                                           tree)).grid(row=4, column=0)
     tk.Button(root, text="Edit", command=lambda: edit_record(name_entry, date_entry,
-                                                           age_entry, tree)).grid(row=4, column=1)
+                                                           tree)).grid(row=4, column=1)
     tk.Button(root, text="Delete", command=lambda: delete_record(tree)).grid(row=4, column=2)
     tk.Button(root, text="Notify Now", command=lambda: notify_now(API_KEY)).grid(row=5, column=0)
     tk.Button(root, text="Exit", command=root.quit).grid(row=5, column=1)
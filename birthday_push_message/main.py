@@ -1,11 +1,10 @@
 """
 Main entry point for the Birthday Push Message application.
 This script initializes the database, handles command-line arguments for various tasks
-such as updating ages, sending notifications, adding or deleting birthdays, and starting the GUI.
+such as sending notifications, adding, importing or deleting birthdays, and starting the GUI.
 """
 import argparse
-from .database import (initialize_database, update_age_if_birthday,
-                      add_birthday, delete_birthday_v2)
+from .database import get_store, import_birthdays_from_csv
 from .gui import create_gui
 from.scheduler import check_and_send_birthdays
 from .config import API_KEY
@@ -14,21 +13,29 @@ def main():
     """Main entry point for the application."""
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Birthday Manager")
-    parser.add_argument("--update", action="store_true", help="Update ages for today's birthdays")
+    parser.add_argument("--update", action="store_true", help="Update ages for today's birthdays "\
+                                                              "(not needed anymore, ages are "\
+                                                              "derived from the birth year)")
     parser.add_argument("--notify", action="store_true", help="Send birthday notifications")
-    parser.add_argument("--add", nargs=3, type=str, help="add new birthday to the database "\
-                                                         "(name,date,age)")
+    parser.add_argument("--add", nargs='+', type=str, help="add new birthday to the database "\
+                                                           "(name,date), an age given "\
+                                                           "after the date is ignored")
+    parser.add_argument("--import", dest="import_file", metavar="FILE",
+                        help="Import birthdays from a CSV file (Name;Day;Month;Year)")
     parser.add_argument("--delete", nargs=2, type=str, help="Delete a birthday from the database "\
                                                             "(name,date)")
     parser.add_argument("--gui", action="store_true", help="Start the GUI application")
     args = parser.parse_args()
+    # Scripts written before the age was derived still pass it as third value
+    if args.add is not None and len(args.add) not in (2, 3):
+        parser.error("--add expects name and date (and optionally the former age)")
 
-    # Initialize the database
-    initialize_database()
+    # Open (and if needed initialize) the database
+    store = get_store()
 
     # Handle tasks based on arguments
     if args.update:
-        update_age_if_birthday()
+        print("Ages are derived from the birth year, nothing to update")
 
     elif args.notify:
         check_and_send_birthdays(API_KEY)
@@ -36,13 +43,19 @@ def main():
     elif args.add:
         name = args.add[0]
         date = args.add[1]
-        age  = args.add[2]
-        add_birthday(name,date,age)
+        if store.add(name, date) is None:
+            print(f"{name} ({date}) is already stored")
+
+    elif args.import_file:
+        result = import_birthdays_from_csv(args.import_file)
+        if result is not None:
+            print(f"{result.inserted} inserted, {result.updated} updated, "
+                  f"{result.skipped} skipped")
 
     elif args.delete:
         name = args.delete[0]
         date = args.delete[1]
-        delete_birthday_v2(name, date)
+        store.delete_by_name_and_date(name, date)
 
     else:
         create_gui()
@@ -1,15 +1,93 @@
 """
-This module contains a function to send push notifications using Pushbullet.
+This module sends push notifications using Pushbullet.
+A PushNotifier keeps one Pushbullet client, so the account data is loaded
+once and all pushes share its HTTP session. Independent pushes are sent
+concurrently by a small thread pool, several messages can also be combined
+into one digest push.
+pushbullet is imported on the first push, so readers of the birthday
+list (e.g. the e-paper display) don't pay for importing it.
 """
-from pushbullet import Pushbullet
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import metrics
+
+# Pushes sent at the same time at most
+MAX_WORKERS = 4
+
+class PushNotifier:
+    """
+    Sends pushes with one long-lived Pushbullet client. client can be given,
+    e.g. one pointing to another server, otherwise it is created on the first push.
+    """
+    def __init__(self, api_key, max_workers=MAX_WORKERS, client=None):
+        self.api_key = api_key
+        self.max_workers = max_workers
+        self._client = client
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        """Return the Pushbullet client, it is created (loading the account data) once."""
+        with self._lock:
+            if self._client is None:
+                from pushbullet import Pushbullet
+                self._client = Pushbullet(self.api_key)
+            return self._client
+
+    def send(self, title, message):
+        """Send a push, returns whether it was sent."""
+        try:
+            self.client().push_note(title, message)
+        except Exception as e:
+            print(f"Error sending push message: {e}")
+            metrics.count('pushes', result='failed')
+            return False
+        metrics.count('pushes', result='sent')
+        return True
+
+    def send_all(self, pushes):
+        """
+        Send (title, message) pushes concurrently, at most max_workers at a
+        time. Returns whether each one was sent, in the order of pushes.
+        """
+        pushes = list(pushes)
+        if len(pushes) <= 1:
+            return [self.send(title, message) for title, message in pushes]
+        # the account data is loaded once, before the workers start
+        try:
+            self.client()
+        except Exception as e:
+            print(f"Error sending push message: {e}")
+            metrics.count('pushes', value=len(pushes), result='failed')
+            return [False] * len(pushes)
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='push')
+            pool = self._pool
+        return list(pool.map(lambda push: self.send(*push), pushes))
+
+    def send_digest(self, title, messages):
+        """Send messages as one push, one per line. Returns whether it was sent."""
+        messages = list(messages)
+        if not messages:
+            return True
+        return self.send(title, '\n'.join(messages))
+
+    def close(self):
+        """Stop the workers and drop the client."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            self._client = None
+
+@functools.lru_cache(maxsize=None)
+def get_notifier(api_key):
+    """Return the shared PushNotifier of an API key, the client is created on the first push."""
+    return PushNotifier(api_key)
 
 def send_push_message(api_key, title, message):
     """Send a push message using Pushbullet."""
-    try:
-        print(f"Debug: Initializing Pushbullet with API key: {api_key}")
-        pb = Pushbullet(api_key)
-        print(f"Debug: Sending push message with title: '{title}' and message: '{message}'")
-        push = pb.push_note(title, message)
-        print(f"Debug: Push sent successfully: {push}")
-    except Exception as e:
-        print(f"Error sending push message: {e}")
+    get_notifier(api_key).send(title, message)
@@ -0,0 +1,89 @@
+"""
+Local stub of the parts of the Pushbullet API used to send notes, for
+tests/test_push_notification.py and benchmarks/push_delivery.py, so neither
+needs an account or network. It records the pushes it receives.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Pushes with this title are refused
+FAILING_TITLE = 'fail'
+
+ACCOUNT_DATA = {
+    '/v2/devices': {'devices': []},
+    '/v2/chats': {'chats': []},
+    '/v2/users/me': {'iden': 'stub', 'email': 'stub@example.org'},
+    '/v2/channels': {'channels': []},
+}
+
+# Pushbullet client attributes and the paths of the stub
+CLIENT_URLS = {
+    'DEVICES_URL': '/v2/devices',
+    'CHATS_URL': '/v2/chats',
+    'CHANNELS_URL': '/v2/channels',
+    'ME_URL': '/v2/users/me',
+    'PUSH_URL': '/v2/pushes',
+}
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers after server.latency seconds, like a remote server."""
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Account data, loaded by every new client."""
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.account_requests += 1
+        if self.path in ACCOUNT_DATA:
+            self._reply(200, ACCOUNT_DATA[self.path])
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        """A push, recorded unless it has the failing title."""
+        with self.server.lock:
+            self.server.requests += 1
+        push = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if push.get('title') == FAILING_TITLE:
+            self._reply(500, {'error': 'refused'})
+            return
+        with self.server.lock:
+            self.server.pushes.append(push)
+            iden = str(len(self.server.pushes))
+        self._reply(200, dict(push, iden=iden))
+
+    def log_message(self, *args):
+        pass
+
+def start_stub(latency=0.0):
+    """Start the stub in a thread, returns the server. Stop it with server.shutdown()."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.pushes = []
+    server.requests = 0
+    server.account_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def client_urls(server):
+    """Return the URL attributes of a Pushbullet client sending to the stub."""
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    return {name: url + path for name, path in CLIENT_URLS.items()}
+
+def stub_client_class(server):
+    """Return a Pushbullet client class sending to the stub."""
+    from pushbullet import Pushbullet
+    return type('StubPushbullet', (Pushbullet,), client_urls(server))
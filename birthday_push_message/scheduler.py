@@ -3,38 +3,47 @@ function to check the database for today's birthdays and send push messages
 or return a list of birthday messages
 """
 
+import sqlite3
 from datetime import datetime
-from .database import get_birthdays, update_age_if_birthday
-from .push_notification import send_push_message
+from instrumentation import metrics
+from .config import DIGEST
+from .database import get_store
+from .push_notification import get_notifier
 
-def check_and_send_birthdays(api_key, mode='send'):
-    """Check the database for today's birthdays and send push messages."""
-    # Update ages if today is a birthday
-    update_age_if_birthday()
-    today = datetime.now().strftime("%d.%m.%Y")
-    birthdays = get_birthdays()
-    birthday_list = []
-    for birthday in birthdays:
-        name, date, age = birthday[1], birthday[2], birthday[3]
-        if date[:-5] == today[:-5]:
-            message = ''
-            appendage = 'th'
-            if str(age) == '-1':
-                message = f"Today is {name}'s birthday!"
-                appendage = ''
-            elif str(age).endswith('1'):
-                appendage = 'st'
-            elif str(age).endswith('2'):
-                appendage = 'nd'
-            elif str(age).endswith('3'):
-                appendage = 'rd'
+def birthday_message(name, age):
+    """Return the message of a birthday, age is None if the year is unknown."""
+    if age is None:
+        return f"Today is {name}'s birthday!"
+    if age % 100 in (11, 12, 13):
+        appendage = 'th'
+    else:
+        appendage = {1: 'st', 2: 'nd', 3: 'rd'}.get(age % 10, 'th')
+    return f"Today is {name}'s {age}{appendage} birthday!"
 
-            if appendage != '':
-                message = f"Today is {name}'s {age}{appendage} birthday!"
+def send_birthday_messages(api_key, messages, digest=DIGEST):
+    """
+    Send birthday messages as one digest push or as one push each, sent
+    concurrently. Returns whether all were sent.
+    """
+    notifier = get_notifier(api_key)
+    if digest:
+        return notifier.send_digest("Birthday Reminder", messages)
+    return all(notifier.send_all([("Birthday Reminder", message) for message in messages]))
 
-            if mode == 'send':
-                send_push_message(api_key, "Birthday Reminder", message)
-            else:
-                birthday_list.append(message)
-    if mode != 'send':
+def check_and_send_birthdays(api_key, mode='send', db_path=None):
+    """
+    Check the database (default: database.DB_PATH) for today's birthdays and send push messages
+    (see send_birthday_messages), or return the messages if mode isn't 'send'.
+    Only reads the database, the ages are derived from the birth years.
+    """
+    with metrics.span('query'):
+        try:
+            birthdays = get_store(db_path).on_date(datetime.now())
+        except sqlite3.Error as e:
+            print(f"Error fetching birthdays: {e}")
+            birthdays = []
+    birthday_list = [birthday_message(birthday.name, birthday.age) for birthday in birthdays]
+    if mode == 'send':
+        send_birthday_messages(api_key, birthday_list)
+    else:
         return birthday_list
@@ -0,0 +1,133 @@
+"""
+Output backends of the dashboard.
+All backends implement the part of the Waveshare epd7in5_V2 interface used by
+the display scripts: the real panel, a file writer and an in-memory recorder,
+so the refresh can run and be timed off the device.
+The backend is chosen with BACKEND (and BACKEND_OPTIONS) in e_paper/config.py.
+"""
+import os
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_PATH = os.path.join(BASE_DIR, 'dashboard.png')
+
+def waveshare_epd(model='epd7in5_V2'):
+    """
+    The real panel. The epaper package is only imported here, the other
+    backends work without it.
+    """
+    import epaper
+    return epaper.epaper(model).EPD()
+
+def _pack(image):
+    """Pack an image like the driver does: 1 bit per pixel, 1 = black."""
+    return bytearray(np.bitwise_not(np.frombuffer(image.convert('1').tobytes(),
+                                                  dtype=np.uint8)).tobytes())
+
+def _unpack(buffer, size):
+    """Turn a driver buffer back into a mode '1' image."""
+    data = np.bitwise_not(np.frombuffer(bytes(buffer), dtype=np.uint8)).tobytes()
+    return Image.frombytes('1', size, data)
+
+class RecordingEPD:
+    """
+    In-memory EPD which records every call it receives.
+    """
+    # seconds to wait after a refresh, the real panel needs about 2
+    settle_time = 0
+
+    def __init__(self, width=800, height=480):
+        self.width = width
+        self.height = height
+        self.calls = []
+        # last buffer handed to display() or display_Partial()
+        self.buffer = None
+
+    def init(self):
+        """Record a full refresh initialization."""
+        self.calls.append(('init',))
+
+    def init_part(self):
+        """Record a partial refresh initialization."""
+        self.calls.append(('init_part',))
+
+    def Clear(self):
+        """Record clearing the panel."""
+        self.calls.append(('Clear',))
+
+    def getbuffer(self, image):
+        """Pack an image like the driver does: 1 bit per pixel, 1 = black."""
+        return _pack(image)
+
+    def display(self, buffer):
+        """Record a full refresh."""
+        self.buffer = bytes(buffer)
+        self.calls.append(('display', len(self.buffer)))
+
+    def display_Partial(self, buffer, x_start, y_start, x_end, y_end):
+        """Record a partial refresh of a window."""
+        self.buffer = bytes(buffer)
+        self.calls.append(('display_Partial', x_start, y_start, x_end, y_end))
+
+    def sleep(self):
+        """Record putting the panel to sleep."""
+        self.calls.append(('sleep',))
+
+class FileEPD:
+    """
+    Writes what the panel would show to an image file after every refresh.
+    The format follows the file extension, e.g. .png or .pbm.
+    """
+    settle_time = 0
+
+    def __init__(self, path=OUTPUT_PATH, width=800, height=480):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.frame = Image.new('1', (width, height), 255)
+
+    def _write(self):
+        root, extension = os.path.splitext(self.path)
+        tmp_path = root + '.tmp' + extension
+        self.frame.save(tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def init(self):
+        """Nothing to initialize."""
+
+    def init_part(self):
+        """Nothing to initialize."""
+
+    def Clear(self):
+        """Clear the frame to white."""
+        self.frame = Image.new('1', (self.width, self.height), 255)
+
+    def getbuffer(self, image):
+        """Pack an image like the driver does: 1 bit per pixel, 1 = black."""
+        return _pack(image)
+
+    def display(self, buffer):
+        """Show a full frame and write it to the file."""
+        self.frame = _unpack(buffer, (self.width, self.height))
+        self._write()
+
+    def display_Partial(self, buffer, x_start, y_start, x_end, y_end):
+        """Show a window of the frame and write the frame to the file."""
+        self.frame.paste(_unpack(buffer, (x_end - x_start, y_end - y_start)), (x_start, y_start))
+        self._write()
+
+    def sleep(self):
+        """Nothing to put to sleep."""
+
+BACKENDS = {
+    'epd': waveshare_epd,
+    'file': FileEPD,
+    'recording': RecordingEPD,
+}
+
+def create_backend(name, **options):
+    """Create the backend with the given name, see BACKENDS."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, choose one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
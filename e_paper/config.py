@@ -0,0 +1,53 @@
+"""
+Configuration of the e-paper dashboard.
+The daemon (`python3 -m e_paper.daemon`) reloads this file on SIGHUP.
+"""
+# Define values for latitude and longitude
+LATITUDE = 0.0  # Replace with your latitude
+LONGITUDE = 0.0 # Replace with your longitude
+
+# Define the path to the weather icons
+PATH_TO_ICONS = 'your_path_to_weather_icons'  # Replace with the actual path to your weather icons
+
+# Additional ICS files, e.g. of other waste collection providers (paper, bio, bulky waste)
+# The yearly abfallkalender<year>.ics files in the abfallkalender folder are always read
+ICS_SOURCES = []
+
+# Output: 'epd' (the panel), 'file' (writes the frame to an image file) or 'recording'
+BACKEND = 'epd'
+# Options of the backend, e.g. {'path': '/tmp/dashboard.png'} for 'file'
+BACKEND_OPTIONS = {}
+
+# Daemon: minutes between refreshes, aligned to the full hour (60 = every full hour)
+REFRESH_MINUTES = 60
+# Daemon: seconds after the aligned time at which the refresh starts, e.g. to
+# pick up the forecast of the new model run
+REFRESH_OFFSET = 0
+
+# Seconds a refresh may spend on the network in total (all requests and retries)
+REFRESH_DEADLINE = 20
+# Forecasts fetched longer ago than this (seconds) are marked as stale on the
+# display, i.e. they could not be refreshed for a while
+STALE_AFTER = 3 * 3600
+
+# Instrumentation (see instrumentation/metrics.py), disabled while both are None.
+# JSON line per span and counter, rotated at 1 MB, e.g. '/var/log/dashboard/metrics.jsonl'
+METRICS_JSONL = None
+# Prometheus textfile written after every refresh, e.g. for the node exporter:
+# '/var/lib/node_exporter/textfile_collector/dashboard.prom'
+METRICS_PROMETHEUS = None
+
+# Several dashboards rendered in one run with `python3 -m e_paper.dashboards`.
+# Every profile may set name, latitude, longitude, ics_sources (list of ICS
+# files), birthday_db (path of a birthday database), backend and
+# backend_options; missing values are taken from the settings above, e.g.
+# DASHBOARDS = [
+#     {'name': 'kitchen', 'latitude': 49.45, 'longitude': 11.08},
+#     {'name': 'grandma', 'latitude': 49.47, 'longitude': 11.12,
+#      'ics_sources': ['/home/pi/grandma.ics'], 'birthday_db': '/home/pi/grandma.db',
+#      'backend': 'file', 'backend_options': {'path': '/var/www/html/grandma.png'}},
+# ]
+DASHBOARDS = []
+# Dashboards whose coordinates are equal when rounded to this many decimals
+# share one forecast (1 decimal: about 10 km)
+SHARED_LOCATION_DIGITS = 1
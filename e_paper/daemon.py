@@ -0,0 +1,96 @@
+"""
+Long-running dashboard process, an alternative to starting
+`e_paper.display_to_epaper` from cron for every refresh.
+The interpreter, imports, fonts, icon atlas, HTTP session and panel driver stay
+loaded between refreshes. Refreshes are aligned to the full hour with the
+cadence set in e_paper/config.py and the panel sleeps in between.
+SIGTERM (or Ctrl+C) stops the daemon after the current refresh, SIGHUP reloads
+the configuration and refreshes right away.
+Run with `python3 -m e_paper.daemon`.
+"""
+import importlib
+import signal
+import time
+from . import config
+from . import display_to_epaper
+
+# Longest time between two checks for signals while waiting
+POLL_INTERVAL = 1.0
+
+def next_refresh(timestamp, minutes=60, offset=0):
+    """
+    Return the time of the first refresh after timestamp. Refreshes happen every
+    `minutes` minutes, counted from the full (local) hour, plus offset seconds.
+    """
+    interval = minutes * 60
+    utc_offset = time.localtime(timestamp).tm_gmtoff
+    local = timestamp + utc_offset - offset
+    return (local // interval + 1) * interval + offset - utc_offset
+
+class DashboardDaemon:
+    """
+    Refreshes the display on schedule until it receives SIGTERM.
+    """
+    def __init__(self):
+        self.resources = None
+        self._stop = False
+        self._reload = False
+
+    def _handle_stop(self, signum, frame):
+        print(f"Received signal {signum}, stopping after the current refresh")
+        self._stop = True
+
+    def _handle_reload(self, signum, frame):
+        print("Received SIGHUP, reloading the configuration")
+        self._reload = True
+
+    def reload_config(self):
+        """
+        Re-reads e_paper/config.py. Location and icons may have changed, so the
+        resources are recreated, only the panel driver is kept.
+        """
+        try:
+            importlib.reload(config)
+        except Exception as e:
+            print(f"Error reloading the configuration, keeping the old one: {e}")
+            return
+        epd = self.resources.epd
+        self.resources.close()
+        self.resources = display_to_epaper.DashboardResources(epd)
+
+    def wait_until(self, timestamp):
+        """
+        Sleeps until timestamp. Returns early if a signal asked to stop or reload.
+        """
+        while not (self._stop or self._reload):
+            remaining = timestamp - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, POLL_INTERVAL))
+
+    def run(self):
+        """
+        Refreshes now and then on every scheduled time.
+        """
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        self.resources = display_to_epaper.DashboardResources()
+        try:
+            while not self._stop:
+                if self._reload:
+                    self._reload = False
+                    self.reload_config()
+                try:
+                    display_to_epaper.display_weather_on_epaper(self.resources)
+                except Exception as e:
+                    # keep running, the next refresh may succeed
+                    print(f"Error refreshing the display: {e}")
+                due = next_refresh(time.time(), config.REFRESH_MINUTES, config.REFRESH_OFFSET)
+                print(f"Next refresh at {time.strftime('%H:%M:%S', time.localtime(due))}")
+                self.wait_until(due)
+        finally:
+            self.resources.close()
+
+if __name__ == "__main__":
+    DashboardDaemon().run()
@@ -0,0 +1,154 @@
+"""
+Several dashboards in one run, e.g. for panels of different households
+driven by the same box. The profiles are defined in DASHBOARDS in
+e_paper/config.py.
+Shared data is prepared once by the main process: the forecasts of all
+profiles are fetched in one batched request (nearby locations share one) and
+the icon atlas is built, the worker processes memory map it. Each dashboard
+is gathered and rasterised in a process pool, the finished frames are sent to
+their outputs by the main process.
+Run with `python3 -m e_paper.dashboards`.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from abfallkalender import agenda
+from instrumentation import metrics
+from birthday_push_message import scheduler as sh
+from meteo_data import open_meteo_data as omd
+from meteo_data import resilience
+from meteo_data.forecast_cache import ForecastCache
+from . import backends
+from . import config
+from . import display_to_epaper
+from . import frame_diff
+from . import icon_atlas
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# DashboardResources of the profiles rendered by a worker process
+_worker_resources = {}
+
+def load_profiles(dashboards=None):
+    """
+    Return the dashboard profiles (default: config.DASHBOARDS), completed
+    with the settings of the single dashboard.
+    """
+    profiles = []
+    for number, dashboard in enumerate(config.DASHBOARDS if dashboards is None else dashboards):
+        profile = {
+            'name': f'dashboard{number}',
+            'latitude': config.LATITUDE,
+            'longitude': config.LONGITUDE,
+            'ics_sources': None,
+            'birthday_db': None,
+            'backend': config.BACKEND,
+            'backend_options': config.BACKEND_OPTIONS,
+        }
+        profile.update(dashboard)
+        profiles.append(profile)
+    return profiles
+
+def shared_location(profile):
+    """Return the location whose forecast is used for a profile."""
+    return (round(profile['latitude'], config.SHARED_LOCATION_DIGITS),
+            round(profile['longitude'], config.SHARED_LOCATION_DIGITS))
+
+def fetch_forecasts(profiles, openmeteo=None, cache=None, deadline=None):
+    """
+    Fetch the forecasts of all profiles in one go, profiles with the same
+    shared location get the same forecast.
+    Returns a list of (hourly_table, daily_table, status) in the order of the
+    profiles, see display_to_epaper.fetch_weather.
+    """
+    locations = sorted({shared_location(profile) for profile in profiles})
+    cache = ForecastCache() if cache is None else cache
+    try:
+        results = omd.fetch_forecast_tables(locations, openmeteo, omd.FORECAST_URL, cache,
+                                            deadline)
+    except Exception as e:
+        print(f"Error fetching the weather: {e}")
+        return [(None, None, display_to_epaper.weather_status(None))] * len(profiles)
+    forecasts = {location: tables + (display_to_epaper.weather_status(
+                     cache.fetched_at(omd.forecast_key(*location))),)
+                 for location, tables in zip(locations, results)}
+    return [forecasts[shared_location(profile)] for profile in profiles]
+
+def frame_path_for(profile):
+    """Path of the last frame of a profile, see frame_diff."""
+    return os.path.join(BASE_DIR, f"last_frame_{profile['name']}.bin")
+
+def render_profile(profile, forecast, now):
+    """
+    Gather the waste collections and birthdays of a profile and render its
+    dashboard. Runs in a worker process, returns the image.
+    """
+    resources = _worker_resources.get(profile['name'])
+    if resources is None:
+        resources = _worker_resources[profile['name']] = display_to_epaper.DashboardResources()
+
+    tomorrow = now + timedelta(days=1)
+    ics_sources = profile['ics_sources']
+    if ics_sources is None:
+        ics_sources = display_to_epaper.default_ics_sources(now, tomorrow)
+    trash_days = agenda.get_agenda(ics_sources, now.date(), tomorrow.date())
+    birthdays = sh.check_and_send_birthdays('nothing', 'do_not_send', profile['birthday_db'])
+
+    hourly_data, daily_data, status = forecast
+    return resources.render(display_to_epaper.widget_data(
+        resources.weather, hourly_data, daily_data, trash_days, birthdays, now, status))
+
+def show(profile, image):
+    """Send the image of a profile to its output. Returns the kind of refresh."""
+    epd = backends.create_backend(profile['backend'], **profile['backend_options'])
+    epd.init()
+    mode = frame_diff.DifferentialRefresher(epd, frame_path_for(profile)).update(image)
+    with metrics.span('sleep'):
+        if mode != 'skip':
+            time.sleep(getattr(epd, 'settle_time', display_to_epaper.SETTLE_TIME))
+        epd.sleep()
+    return mode
+
+def render_dashboards(profiles=None, now=None, max_workers=None, openmeteo=None, cache=None):
+    """
+    Render and show all dashboards. Returns a dict of profile name -> kind of
+    refresh, or None if the dashboard failed.
+    """
+    profiles = load_profiles() if profiles is None else profiles
+    if not profiles:
+        print("No dashboards defined, see DASHBOARDS in e_paper/config.py")
+        return {}
+    now = datetime.now() if now is None else now
+    start = time.perf_counter()
+    # the worker processes inherit the configuration, the Prometheus
+    # textfile holds the totals of this process
+    display_to_epaper.configure_metrics()
+
+    # build the atlas before the workers open it
+    icon_atlas.load_atlas(config.PATH_TO_ICONS).close()
+    forecasts = fetch_forecasts(profiles, openmeteo, cache,
+                                resilience.Deadline(config.REFRESH_DEADLINE))
+    print(f"{len(profiles)} dashboards, {len({shared_location(p) for p in profiles})} "
+          f"forecasts fetched in {time.perf_counter() - start:.2f} s")
+
+    if max_workers is None:
+        max_workers = min(len(profiles), os.cpu_count() or 1)
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(render_profile, profile, forecast, now)
+                   for profile, forecast in zip(profiles, forecasts)]
+        # the first dashboards are shown while the others are still rendered
+        for profile, future in zip(profiles, futures):
+            try:
+                results[profile['name']] = show(profile, future.result())
+            except Exception as e:
+                print(f"Error showing dashboard {profile['name']}: {e}")
+                results[profile['name']] = None
+            print(f"{profile['name']}: {results[profile['name']]} "
+                  f"after {time.perf_counter() - start:.2f} s")
+    metrics.flush()
+    return results
+
+if __name__ == "__main__":
+    render_dashboards()
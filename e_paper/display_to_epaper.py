@@ -4,21 +4,32 @@ on an e-paper display using the Open Meteo API.
 """
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageFont
 import pytz
 import numpy as np
-import epaper
+from instrumentation import metrics
 from meteo_data import open_meteo_data as omd
+from meteo_data import resilience
 from birthday_push_message import scheduler as sh
-from abfallkalender import read_abfall_ics
+from abfallkalender import agenda
+from . import icon_atlas
+from . import text_cache
+from . import widgets
+from . import backends
+from . import config
+from . import frame_diff
 
-# Define values for latitude and longitude
-LATITUDE = 0.0  # Replace with your latitude
-LONGITUDE = 0.0 # Replace with your longitude
+# Location, weather icons and additional ICS files are set in e_paper/config.py
 
-# Define the path to the weather icons
-PATH_TO_ICONS = 'your_path_to_weather_icons'  # Replace with the actual path to your weather icons
+FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+
+# Resolution of the 7.5in V2 panel, known before the panel is initialized
+EPD_WIDTH = 800
+EPD_HEIGHT = 480
+# Seconds to wait after a refresh of the real panel, other backends set settle_time
+SETTLE_TIME = 2
 
 # dicts and lists
 days_dict = {
@@ -36,147 +47,252 @@ units_list = ['[°C]', '[°C]', '[%]', '[mm]', '[%]', '[-]']
 measurements_list = ['Temperatur 2m', 'Temp. gefühlt', 'Luftfeuchte',
                      'Niederschlag', 'Probability', 'UV-Index']    
 
-def draw_text_in_table_format(draw, text_list, x_start, y_start, x_offset, y_offset, font, fill=0):
+def build_layout():
     """
-    Draws text in a table format on the image.
+    Returns the layout of the dashboard: the widgets and their boxes on the panel.
     """
-    for element in text_list:
-        draw.text((x_start, y_start), element, font=font, fill=fill)
-        x_start += x_offset
-        y_start += y_offset
+    row_labels = [((10, 5 + row * 40), text, 'font') for row, text in enumerate(measurements_list)]
+    row_labels += [((250, 5 + row * 40), text, 'font') for row, text in enumerate(units_list)]
+    return widgets.Layout((EPD_WIDTH, EPD_HEIGHT), [
+        widgets.HeaderWidget('header', (0, 0, 375, 105)),
+        widgets.LabelsWidget('row labels', (0, 105, 375, 345), row_labels),
+        widgets.HourlyTableWidget('hourly', (375, 0, 800, 345)),
+        widgets.DailyOutlookWidget('daily', (0, 360, 800, 480)),
+        widgets.ListWidget('birthdays', (470, 340, 800, 480)),
+        widgets.TrashWidget('trash', (500, 380, 800, 480)),
+    ])
 
-def display_weather_on_epaper():
+def timed_stage(timings, name, function, *args):
     """
-    Main function to display weather data on the e-paper display.
+    Runs a stage of the refresh and stores its wall time in timings.
+    """
+    start = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        timings[name] = time.perf_counter() - start
+
+class DashboardResources:
+    """
+    Everything a refresh needs besides the data: panel driver, fonts, icon atlas,
+    widget tiles, rasterised text, weather client and thread pool. The daemon keeps them for all refreshes.
     """
-    # Initialize the e-paper display
-    epd = epaper.epaper('epd7in5_V2').EPD()
-    epd.init()
-    epd.Clear()
+    def __init__(self, epd=None, frame_path=frame_diff.FRAME_PATH):
+        self.epd = epd
+        self.frame_path = frame_path
+        self.refresher = None
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.weather = omd.OpenMeteoWeather(latitude=config.LATITUDE, longitude=config.LONGITUDE)
+        self.font = None
+        self.font_small = None
+        self.atlas = None
+        self.layout = build_layout()
+        self.text = text_cache.TextRenderer()
 
-    # Create a blank image for drawing
-    image = Image.new('1', (epd.width, epd.height), 255)  # 1: black and white
-    draw = ImageDraw.Draw(image)
+    def init_panel(self):
+        """
+        Initializes (wakes up) the e-paper display. It is only cleared when a full refresh is needed.
+        """
+        if self.epd is None:
+            self.epd = backends.create_backend(config.BACKEND, **config.BACKEND_OPTIONS)
+        if self.refresher is None:
+            self.refresher = frame_diff.DifferentialRefresher(self.epd, self.frame_path)
+        self.epd.init()
+        return self.epd
 
-    # Load a font
-    font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 24)
-    font_small = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 18)
+    def load(self):
+        """
+        Loads the fonts and the icon atlas, unless they are loaded already.
+        """
+        if self.font is None:
+            self.font = ImageFont.truetype(FONT_PATH, 24)
+            self.font_small = ImageFont.truetype(FONT_PATH, 18)
+        if self.atlas is None:
+            self.atlas = icon_atlas.load_atlas(config.PATH_TO_ICONS)
 
-    # Fetch weather data
-    weather = omd.OpenMeteoWeather(latitude=LATITUDE, longitude=LONGITUDE)
+    def render(self, data):
+        """
+        Renders the widget data (see widget_data) into an image. Only widgets
+        whose data changed since the last call are drawn again.
+        """
+        self.load()
+        with metrics.span('render'):
+            image, rendered = self.layout.render(
+                data, {'font': self.font, 'font_small': self.font_small, 'atlas': self.atlas,
+                       'text': self.text})
+        metrics.count('widgets_rendered', len(rendered))
+        print(f"Rendered widgets: {', '.join(rendered) or 'none'}, "
+              f"text cache: {self.text.hits} hits, {self.text.freetype_renders} FreeType renders")
+        return image
 
-    #hourly data
-    hourly_data = weather.get_weather_hourly()
+    def close(self):
+        """
+        Waits for running stages and releases the icon atlas.
+        """
+        self.executor.shutdown()
+        if self.atlas is not None:
+            self.atlas.close()
+            self.atlas = None
 
-    #daily data
-    daily_data = weather.get_weather_daily()
+def default_ics_sources(day_now, tomorrow):
+    """
+    The yearly ICS files of the abfallkalender folder and the ICS_SOURCES of the config.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return agenda.yearly_sources(os.path.join(script_dir, '../abfallkalender'),
+                                 day_now, tomorrow) + config.ICS_SOURCES
+
+def weather_status(fetched_at):
+    """
+    Returns the marker shown when the forecast is older than STALE_AFTER (it
+    could not be refreshed) or missing, None for a current forecast.
+    """
+    if fetched_at is None:
+        return 'Wetter: keine Daten'
+    if time.time() - fetched_at <= config.STALE_AFTER:
+        return None
+    return f'Wetter: Stand {datetime.fromtimestamp(fetched_at).strftime("%d.%m. %H:%M")}'
+
+def fetch_weather(weather, deadline):
+    """
+    Fetches the forecast within the deadline of the refresh.
+    Returns (hourly_data, daily_data, status), see weather_status. Without a
+    forecast the data is None and the rest of the dashboard is still shown.
+    """
+    try:
+        hourly_data, daily_data = weather.fetch_forecast_tables(deadline)
+    except Exception as e:
+        print(f"Error fetching the weather: {e}")
+        return None, None, weather_status(None)
+    return hourly_data, daily_data, weather_status(weather.fetched_at())
+
+def widget_data(weather, hourly_data, daily_data, trash_days, birthdays, day_now, status=None):
+    """
+    Turns the gathered data into the input data of the widgets (see build_layout).
+    hourly_data and daily_data are None if no forecast is available, status
+    is the marker of an old or missing forecast (see weather_status).
+    """
+    tomorrow = day_now + timedelta(days=1)
+    day_after_tomorrow = day_now + timedelta(days=2)
 
     #current time
     local_tz = pytz.timezone('UTC')
-    hour_now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    hour_now = day_now.replace(minute=0, second=0, microsecond=0)
     hour_now = local_tz.localize(hour_now)
 
-    day_now = datetime.now()
-    tomorrow = day_now + timedelta(days=1)
-    day_after_tomorrow = day_now + timedelta(days=2)
+    #current day and temperature min/max of current day
+    if daily_data is None:
+        min_max = '-- / --'
+    else:
+        min_max = f'{str(round(daily_data.row(0)[0],1))} / {str(round(daily_data.row(0)[1],1))}'
+    header = (f'{days_dict[day_now.strftime("%A")]}, {day_now.strftime("%d.%m.%Y")}', min_max,
+              status)
 
-    #current day
-    draw.text((10,10), f'{days_dict[day_now.strftime("%A")]}, {day_now.strftime("%d.%m.%Y")}',
-               font=font, fill=0)
+    #hourly data of the next 4 hours, the last two columns are weather code and is_day
+    hours = [hour_now + timedelta(hours=hour_offset) for hour_offset in range(4)]
+    hours = [(hour, None if hourly_data is None else hourly_data.position(hour)) for hour in hours]
+    rows = [(hour, hourly_data.row(position)) for hour, position in hours if position is not None]
+    icon_names = weather.icon_names([row['weather_code'] for _, row in rows],
+                                    [row['is_day'] for _, row in rows])
+    hourly = tuple((hour.strftime('%H:%M'), icon_name,
+                    tuple(str(np.round(row[value], 1)) for value in range(len(row) - 2)))
+                   for (hour, row), icon_name in zip(rows, icon_names))
 
-    #get weather icons
-    # Get weather icons for the next 4 hours (hour_now to hour_now + 3)
-    icons = weather.images_of_weather_icons(PATH_TO_ICONS,
-                                            hourly_data.loc[hour_now:hour_now + timedelta(hours=3)])
+    #daily data of tomorrow and the day after tomorrow
+    daily = []
+    if daily_data is not None:
+        descriptions = weather.descriptions(daily_data.column('weather_code'))
+        for position in range(len(daily_data)):
+            index = daily_data.time(position)
+            if index.date() == tomorrow.date() or index.date() == day_after_tomorrow.date():
+                row = daily_data.row(position)
+                daily.append((days_dict[index.strftime('%A')],
+                              f'{str(round(row[0],0))} / {str(round(row[1],0))}',
+                              str(round(row[3],0)),
+                              descriptions[position].split(':')[0]))
 
     #take out trash?
-    # Construct the relative path dynamically
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    ics_file_path = os.path.join(script_dir, f'../abfallkalender/abfallkalender{day_now.year}.ics')
-    trash_days = read_abfall_ics.get_events_for_today_and_tomorrow(ics_file_path)
-    if trash_days:
-        x_start = 500
-        y_start = 380
-        for trash_day in trash_days:
-            if trash_day['start'] == day_now.date():
-                draw.text((x_start, y_start), f'Heute: {trash_day["summary"]}', font=font_small, fill=0)
-                y_start += 20
-            elif trash_day['start'] == tomorrow.date():
-                draw.text((x_start, y_start + 20), f'Morgen: {trash_day["summary"]}', font=font_small, fill=0)
-                y_start += 20
-
-    #display temmperature min/max of current day
-    draw.text((10,70), 'Temp min/max', font=font, fill=0)
-    draw.text((230,70),
-              f'{str(round(daily_data.iloc[0,0],1))} / {str(round(daily_data.iloc[0,1],1))}'
-              , font=font, fill=0)
-
-    # Display the first few hours of weather data
-    draw_text_in_table_format(draw, measurements_list, 10, 110, 0, 40, font)
-    draw_text_in_table_format(draw, units_list, 250, 110, 0, 40, font)
-
-    x_offset = 375
-    #hourly data
-    for hour_offset in range(4):
-        y_offset = 45
-        hour = hour_now + timedelta(hours=hour_offset)
-        if hour in hourly_data.index:
-            row = hourly_data.loc  [hour]
-            draw.text((x_offset,10), f"{hour.strftime('%H:%M')}", font=font, fill=0)
-            image.paste(icons [hour_offset], (x_offset + 10, y_offset))
-            y_offset = 110
-            for value in range(len(row)):
-                if value < len(row) - 2:
-                    rounded_val = np.round(row.iloc[value],1)
-                    rounded_val = str(rounded_val)
-                    if len(rounded_val) > 3:
-                        draw.text((x_offset + 10,y_offset), rounded_val, font = font, fill=0)
-                    else:
-                        draw.text((x_offset + 26,y_offset), rounded_val, font = font, fill=0)
-                    y_offset += 40
-            x_offset += 110
-
-    #display daily data
-    draw.text((10,380), 'Temp min/max', font=font_small, fill=0)
-    draw.text((10,400), 'N-Summe', font=font_small, fill=0)
-    draw.text((10,420), 'Beschreibung', font=font_small , fill=0)
-
-    x_offset = 180
-    for index in daily_data.index:
-        y_offset = 360
-        if index.date() == tomorrow.date() or index.date() == day_after_tomorrow.date():
-            row = daily_data.loc[index]
-            draw.text((x_offset,y_offset), days_dict[index.strftime('%A')], font=font_small, fill=0)
-            #temperature
-            y_offset += 20
-            str_vals = f'{str(round(row.iloc[0],0))} / {str(round(row.iloc[1],0))}'
-            draw.text((x_offset,y_offset), str_vals, font=font_small, fill=0)
-            #precipitation sum
-            y_offset += 20
-            str_vals = str(round(row.iloc[3],0))
-            draw.text((x_offset,y_offset), str_vals, font=font_small, fill=0)
-            #description
-            y_offset += 20
-            str_vals = weather.weather_code_translations[row.iloc[2]].split(':')[0]
-            draw.text((x_offset,y_offset), str_vals, font=font_small, fill=0)
-            x_offset += 150
-
-
-    #birthday list:
-    birthdays = sh.check_and_send_birthdays('nothing', mode='do_not_send')
-    if birthdays:
-        x_offset = 470
-        y_offset = 340
-        for birthday in birthdays:
-            draw.text((x_offset,y_offset), birthday, font = font_small, fill=0)
-            y_offset += 20
-
-    # Display the image on the e-paper
-    epd.display(epd.getbuffer(image))
-    time.sleep(2)
-
-    # Put the display to sleep
-    epd.sleep()
+    trash = tuple((trash_day['start'] == day_now.date(), trash_day['summary'])
+                  for trash_day in trash_days or []
+                  if trash_day['start'] in (day_now.date(), tomorrow.date()))
+
+    return {'header': header, 'hourly': hourly, 'daily': tuple(daily),
+            'trash': trash, 'birthdays': tuple(birthdays or [])}
+
+def configure_metrics():
+    """Enable or disable the instrumentation as set in config.py."""
+    metrics.configure(config.METRICS_JSONL, config.METRICS_PROMETHEUS)
+
+def display_weather_on_epaper(resources=None, now=None):
+    """
+    Main function to display weather data on the e-paper display.
+    Initializing the panel, fetching the weather, reading the waste collection
+    calendar and querying the birthdays don't depend on each other and run
+    concurrently. The wall time of each stage is printed at the end.
+    Without resources they are created for this refresh only. now (default:
+    the current time) sets the date and hour shown. Returns the timings.
+    """
+    refresh_start = time.perf_counter()
+    configure_metrics()
+    timings = {}
+    owns_resources = resources is None
+    if owns_resources:
+        resources = DashboardResources()
+    executor = resources.executor
+    weather = resources.weather
+
+    day_now = datetime.now() if now is None else now
+    tomorrow = day_now + timedelta(days=1)
+    ics_sources = default_ics_sources(day_now, tomorrow)
+
+    # All network calls of this refresh share one time budget
+    deadline = resilience.Deadline(config.REFRESH_DEADLINE)
+
+    # Initialize the e-paper display (takes seconds) while the data is gathered
+    panel_future = executor.submit(timed_stage, timings, 'panel init', resources.init_panel)
+    mode = None
+    try:
+        #hourly and daily data in one request, as lightweight tables (no pandas needed)
+        weather_future = executor.submit(timed_stage, timings, 'weather',
+                                         fetch_weather, weather, deadline)
+        trash_future = executor.submit(timed_stage, timings, 'waste calendar', agenda.get_agenda,
+                                       ics_sources, day_now.date(), tomorrow.date())
+        birthday_future = executor.submit(timed_stage, timings, 'birthdays',
+                                          sh.check_and_send_birthdays, 'nothing', 'do_not_send')
+
+        # Load the fonts and the icon atlas (kept loaded by the daemon)
+        resources.load()
+
+        hourly_data, daily_data, status = weather_future.result()
+        render_start = time.perf_counter()
+
+        # Only widgets whose data changed since the last refresh are drawn again
+        image = resources.render(widget_data(weather, hourly_data, daily_data,
+                                             trash_future.result(), birthday_future.result(),
+                                             day_now, status))
+        timings['render'] = time.perf_counter() - render_start
+
+        # Display the image on the e-paper, only the changed part is refreshed if possible
+        panel_future.result()
+        mode = timed_stage(timings, 'display', resources.refresher.update, image)
+        print(f"Refresh: {mode}")
+    finally:
+        # Put the display to sleep, also if a stage failed: the daemon would
+        # leave it awake until the next refresh
+        if panel_future.exception() is None:
+            epd = panel_future.result()
+            with metrics.span('sleep'):
+                if mode not in (None, 'skip'):
+                    time.sleep(getattr(epd, 'settle_time', SETTLE_TIME))
+                epd.sleep()
+        if owns_resources:
+            resources.close()
+
+    timings['total'] = time.perf_counter() - refresh_start
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.2f} s")
+    metrics.flush()
+    return timings
 
 if __name__ == "__main__":
     display_weather_on_epaper()
@@ -0,0 +1,122 @@
+"""
+Differential refresh of the e-paper display.
+The last frame sent to the panel is stored on disk. A new frame is compared
+with it by XOR-ing the packed 1-bit buffers: an identical frame is not sent at
+all, a small change is sent as partial refresh of the changed window and
+everything else, as well as every FULL_REFRESH_EVERY-th update, gets a full
+refresh which also clears the ghosting left by partial refreshes.
+"""
+import json
+import os
+import numpy as np
+from instrumentation import metrics
+from .framebuffer import FrameBuffer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_PATH = os.path.join(BASE_DIR, 'last_frame.bin')
+
+# Number of partial refreshes before the next full refresh
+FULL_REFRESH_EVERY = 10
+# Changed windows larger than this share of the panel get a full refresh
+MAX_PARTIAL_AREA = 0.5
+
+def pack_frame(image):
+    """Return a mode '1' image as array of packed rows (one bit per pixel, 1 = white)."""
+    if image.mode != '1':
+        image = image.convert('1')
+    # about twice as fast as image.tobytes(), which goes through PIL's raw encoder
+    return np.packbits(np.asarray(image), axis=1)
+
+def changed_window(old_frame, new_frame):
+    """
+    Return the window (x_start, y_start, x_end, y_end) containing all changed pixels,
+    aligned to whole bytes, or None if the frames are identical.
+    """
+    diff = np.bitwise_xor(old_frame, new_frame)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return None
+    columns = np.flatnonzero(diff.any(axis=0))
+    return (int(columns[0]) * 8, int(rows[0]), (int(columns[-1]) + 1) * 8, int(rows[-1]) + 1)
+
+class DifferentialRefresher:
+    """
+    Sends frames to an EPD, using partial refreshes where possible.
+    """
+    def __init__(self, epd, frame_path=FRAME_PATH, full_refresh_every=FULL_REFRESH_EVERY,
+                 max_partial_area=MAX_PARTIAL_AREA):
+        self.epd = epd
+        self.frame_path = frame_path
+        self.state_path = os.path.splitext(frame_path)[0] + '.json'
+        self.full_refresh_every = full_refresh_every
+        self.max_partial_area = max_partial_area
+        # reused for every refresh, created with the size of the first frame
+        self.framebuffer = None
+
+    def _load(self, shape):
+        """Return the last frame and the number of partial refreshes since the last full one."""
+        try:
+            frame = np.fromfile(self.frame_path, dtype=np.uint8)
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                partial_refreshes = json.load(file)['partial_refreshes']
+        except (OSError, ValueError, KeyError):
+            return None, 0
+        if frame.size != shape[0] * shape[1]:
+            return None, 0
+        return frame.reshape(shape), partial_refreshes
+
+    def _store(self, frame, partial_refreshes):
+        """Store the frame on the panel, the frame is written last."""
+        with open(self.state_path, 'w', encoding='utf-8') as file:
+            json.dump({'partial_refreshes': partial_refreshes}, file)
+        tmp_path = self.frame_path + '.tmp'
+        frame.tofile(tmp_path)
+        os.replace(tmp_path, self.frame_path)
+
+    def choose(self, new_frame):
+        """
+        Decide how to show a frame. Returns the kind of refresh ('skip', 'partial'
+        or 'full'), the changed window and the number of partial refreshes so far.
+        """
+        old_frame, partial_refreshes = self._load(new_frame.shape)
+        if old_frame is None:
+            return 'full', None, partial_refreshes
+        window = changed_window(old_frame, new_frame)
+        if window is None:
+            return 'skip', None, partial_refreshes
+        x_start, y_start, x_end, y_end = window
+        area = (x_end - x_start) * (y_end - y_start) / (new_frame.shape[0] *
+                                                        new_frame.shape[1] * 8)
+        if partial_refreshes >= self.full_refresh_every or area > self.max_partial_area:
+            return 'full', window, partial_refreshes
+        return 'partial', window, partial_refreshes
+
+    def update(self, image):
+        """
+        Show an image on the panel. Returns the kind of refresh: 'skip', 'partial' or 'full'.
+        The panel must have been woken up with epd.init() before.
+        """
+        with metrics.span('pack'):
+            new_frame = pack_frame(image)
+            mode, window, partial_refreshes = self.choose(new_frame)
+        metrics.count('refreshes', kind=mode)
+        if mode == 'skip':
+            return mode
+
+        if self.framebuffer is None or (self.framebuffer.height,
+                                        self.framebuffer.row_bytes) != new_frame.shape:
+            self.framebuffer = FrameBuffer(*image.size)
+
+        with metrics.span('transfer', kind=mode):
+            if mode == 'partial':
+                # the driver expects the packed, inverted bytes of the window only
+                self.epd.init_part()
+                self.epd.display_Partial(self.framebuffer.pack_window(new_frame, window), *window)
+                partial_refreshes += 1
+            else:
+                # packed directly instead of epd.getbuffer(image)
+                self.epd.Clear()
+                self.epd.display(self.framebuffer.pack(new_frame))
+                partial_refreshes = 0
+        self._store(new_frame, partial_refreshes)
+        return mode
@@ -0,0 +1,37 @@
+"""
+Packed framebuffer in the byte layout of the panel.
+The vendor getbuffer() converts the image again and inverts it byte by byte in
+Python. Here the packed frame (see frame_diff.pack_frame) is inverted by numpy
+straight into one preallocated bytearray, which is handed to the driver as it
+is. The daemon keeps the buffer, so refreshes don't allocate a new one.
+"""
+import numpy as np
+
+class FrameBuffer:
+    """
+    1 bit per pixel, rows padded to whole bytes, 1 = black (the panel's layout).
+    """
+    def __init__(self, width=800, height=480):
+        self.width = width
+        self.height = height
+        self.row_bytes = (width + 7) // 8
+        self.buffer = bytearray(self.row_bytes * height)
+        # numpy view of the same memory
+        self._array = np.frombuffer(self.buffer, dtype=np.uint8)
+
+    def pack(self, frame):
+        """
+        Write a packed frame (1 = white) into the buffer. Returns the buffer.
+        """
+        np.bitwise_not(frame, out=self._array.reshape(frame.shape))
+        return self.buffer
+
+    def pack_window(self, frame, window):
+        """
+        Write the byte aligned window (x_start, y_start, x_end, y_end) of a packed
+        frame into the start of the buffer. Returns a memoryview of the window's bytes.
+        """
+        x_start, y_start, x_end, y_end = window
+        part = frame[y_start:y_end, x_start // 8:x_end // 8]
+        np.bitwise_not(part, out=self._array[:part.size].reshape(part.shape))
+        return memoryview(self.buffer)[:part.size]
@@ -0,0 +1,162 @@
+"""
+Sprite atlas of pre-rendered 1-bit weather icons.
+The atlas is built once from the BMP icons: every icon is resized to the sizes
+used by the layout, dithered to 1-bit and packed into a single file. At runtime
+the file is memory mapped and icons are sliced out of it, so a refresh needs
+no image decoding, resizing or reads of the single icon files.
+The header records the icon folder and the name, modification time and size
+of every BMP, load_atlas builds the atlas again when they don't match.
+Build the atlas with `python3 -m e_paper.icon_atlas <path_to_weather_icons>`.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ATLAS_PATH = os.path.join(BASE_DIR, 'weather_icons.atlas')
+
+ATLAS_MAGIC = b'ICA1'
+# Sizes of the icons used by the layout
+ICON_SIZES = [(50, 50)]
+
+def icon_paths(path_to_icon_folder):
+    """Return the paths of the BMP icons of a folder, sorted."""
+    return sorted(glob.glob(os.path.join(path_to_icon_folder, '*.bmp')))
+
+def icon_sources(image_paths):
+    """Return [file name, mtime in ns, size] of every icon, stored in the atlas header."""
+    sources = []
+    for image_path in image_paths:
+        stat = os.stat(image_path)
+        sources.append([os.path.basename(image_path), stat.st_mtime_ns, stat.st_size])
+    return sources
+
+def build_atlas(path_to_icon_folder, atlas_path=ATLAS_PATH, sizes=None):
+    """
+    Render all BMP icons of a folder in all sizes to 1-bit and pack them into one file.
+    File layout: magic, header length (uint32), JSON header, packed icon data.
+    Raises FileNotFoundError if the folder contains no BMP icons.
+    """
+    sizes = ICON_SIZES if sizes is None else sizes
+    image_paths = icon_paths(path_to_icon_folder)
+    if not image_paths:
+        raise FileNotFoundError(f"No BMP icons in {path_to_icon_folder}, see PATH_TO_ICONS")
+    entries = {}
+    chunks = []
+    offset = 0
+    for image_path in image_paths:
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        with Image.open(image_path) as image:
+            image = image.convert('L')
+            for width, height in sizes:
+                # dithered like the implicit conversion when pasting into the mode '1' canvas
+                data = image.resize((width, height)).convert('1').tobytes()
+                entries[f'{name}@{width}x{height}'] = [offset, width, height]
+                chunks.append(data)
+                offset += len(data)
+
+    header = json.dumps({
+        'source': os.path.abspath(path_to_icon_folder),
+        'sizes': [list(size) for size in sizes],
+        'icons': icon_sources(image_paths),
+        'entries': entries,
+    }).encode('utf-8')
+    tmp_path = atlas_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(ATLAS_MAGIC + struct.pack('<I', len(header)) + header)
+        for chunk in chunks:
+            file.write(chunk)
+    os.replace(tmp_path, atlas_path)
+    return len(entries)
+
+class IconAtlas:
+    """
+    Memory mapped icon atlas, see build_atlas.
+    """
+    def __init__(self, atlas_path=ATLAS_PATH):
+        with open(atlas_path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:4] != ATLAS_MAGIC:
+            raise ValueError(f"Not an icon atlas: {atlas_path}")
+        header_length = struct.unpack('<I', self._mmap[4:8])[0]
+        self._data_start = 8 + header_length
+        header = json.loads(self._mmap[8:self._data_start])
+        self.entries = header['entries']
+        # missing in atlases of older versions, they are built again
+        self.source = header.get('source')
+        self.sizes = header.get('sizes')
+        self.sources = header.get('icons')
+        self._icons = {}
+
+    def is_current(self, path_to_icon_folder, sizes=None):
+        """
+        Return whether the atlas was built from the icons as they are now in
+        the folder, in the given sizes (default: ICON_SIZES).
+        """
+        sizes = ICON_SIZES if sizes is None else sizes
+        return (self.source == os.path.abspath(path_to_icon_folder)
+                and self.sizes == [list(size) for size in sizes]
+                and self.sources == icon_sources(icon_paths(path_to_icon_folder)))
+
+    def icon(self, name, size=ICON_SIZES[0]):
+        """
+        Return the mode '1' image of an icon, or None if the atlas doesn't contain it.
+        """
+        key = f'{name}@{size[0]}x{size[1]}'
+        if key not in self._icons:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            offset, width, height = entry
+            start = self._data_start + offset
+            length = (width + 7) // 8 * height
+            self._icons[key] = Image.frombuffer('1', (width, height),
+                                                self._mmap[start:start + length],
+                                                'raw', '1', 0, 1)
+        return self._icons[key]
+
+    def icons(self, icon_names, size=ICON_SIZES[0]):
+        """
+        Return the images of a list of icon names. Unknown icons (and None)
+        are returned as empty white images.
+        """
+        images = []
+        for name in icon_names:
+            image = self.icon(name, size) if name is not None else None
+            if image is None:
+                print(f"No icon {name} in atlas")
+                image = Image.new('1', size, 255)
+            images.append(image)
+        return images
+
+    def close(self):
+        """Close the memory map."""
+        self._mmap.close()
+
+def load_atlas(path_to_icon_folder, atlas_path=ATLAS_PATH):
+    """
+    Open the icon atlas. It is built first if it doesn't exist yet or if the
+    folder or its icons changed since it was built (see IconAtlas.is_current).
+    """
+    if os.path.exists(atlas_path):
+        try:
+            atlas = IconAtlas(atlas_path)
+        except (OSError, ValueError) as e:
+            print(f"Error opening the icon atlas, building it again: {e}")
+        else:
+            if atlas.is_current(path_to_icon_folder):
+                return atlas
+            atlas.close()
+            print(f"Icons in {path_to_icon_folder} changed, building the icon atlas again")
+    build_atlas(path_to_icon_folder, atlas_path)
+    return IconAtlas(atlas_path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python3 -m e_paper.icon_atlas <path_to_weather_icons>")
+        sys.exit(1)
+    print(f"{build_atlas(sys.argv[1])} icons written to {ATLAS_PATH}")
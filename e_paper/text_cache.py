@@ -0,0 +1,105 @@
+"""
+Cache of rasterised text.
+Labels such as the measurement names, units and weekdays are the same on every
+refresh. They are rendered by FreeType once and kept as 1-bit masks in an LRU
+cache keyed by (text, font file, size). Numbers change with every forecast, so
+they are composed from a digit atlas instead: the glyphs of NUMERAL_CHARS are
+rasterised once per font (on first use) and placed at their advance widths,
+which gives the same pixels as rendering the whole string for fonts without
+kerning between these characters (like DejaVu).
+"""
+import collections
+import math
+from PIL import Image, ImageDraw
+
+# Characters of the numbers, times and ranges shown on the dashboard
+NUMERAL_CHARS = frozenset('0123456789.,-:/ ')
+
+# Number of cached texts
+MAX_TEXTS = 256
+
+def render_mask(text, font):
+    """
+    Rasterise text with FreeType. Returns a mode '1' mask (set where the text
+    is black) and its offset from the position passed to draw.text, or None
+    if the text has no ink. The mask is cropped to the rendered ink, the box
+    of font.getbbox can be a pixel narrower than it.
+    """
+    left, top, right, bottom = font.getbbox(text)
+    pad = max(2, font.size // 4)
+    canvas = Image.new('1', (right - left + 2 * pad, bottom - top + 2 * pad), 0)
+    ImageDraw.Draw(canvas).text((pad - left, pad - top), text, font=font, fill=255)
+    ink = canvas.getbbox()
+    if ink is None:
+        return None
+    return canvas.crop(ink), (left - pad + ink[0], top - pad + ink[1])
+
+class TextRenderer:
+    """
+    Draws black text onto mode '1' images like draw.text, using the caches.
+    """
+    def __init__(self, max_texts=MAX_TEXTS):
+        self.max_texts = max_texts
+        self._texts = collections.OrderedDict()
+        # (font file, size) -> char -> ((mask, offset) or None for blanks, advance)
+        self._digits = {}
+        self.hits = 0
+        self.freetype_renders = 0
+
+    def _text_mask(self, text, font):
+        """Return the mask and offset of a text, from the LRU cache if possible."""
+        key = (text, font.path, font.size)
+        if key in self._texts:
+            cached = self._texts[key]
+            self._texts.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.freetype_renders += 1
+        cached = self._texts[key] = render_mask(text, font)
+        if len(self._texts) > self.max_texts:
+            self._texts.popitem(last=False)
+        return cached
+
+    def _glyph(self, atlas, char, font):
+        """Return a glyph of the digit atlas, it is rasterised on first use."""
+        if char not in atlas:
+            atlas[char] = (render_mask(char, font), font.getlength(char))
+            self.freetype_renders += 1
+        return atlas[char]
+
+    def _numeral_mask(self, text, font):
+        """Compose the mask of a number from the digit atlas."""
+        atlas = self._digits.setdefault((font.path, font.size), {})
+        parts = []
+        x_position = 0.0
+        for char in text:
+            glyph, advance = self._glyph(atlas, char, font)
+            if glyph is not None:
+                mask, (left, top) = glyph
+                # FreeType places glyphs at the rounded sum of the advances
+                parts.append((mask, math.floor(x_position + 0.5) + left, top))
+            x_position += advance
+        if not parts:
+            return None
+        x_start = min(x for _, x, _ in parts)
+        y_start = min(y for _, _, y in parts)
+        x_end = max(x + mask.size[0] for mask, x, _ in parts)
+        y_end = max(y + mask.size[1] for mask, _, y in parts)
+        composed = Image.new('1', (x_end - x_start, y_end - y_start), 0)
+        for mask, x, y in parts:
+            composed.paste(255, (x - x_start, y - y_start), mask)
+        self.hits += 1
+        return composed, (x_start, y_start)
+
+    def draw(self, image, position, text, font):
+        """Draw black text at position, the same pixels as draw.text(position, text, font=font, fill=0)."""
+        if not text:
+            return
+        if NUMERAL_CHARS.issuperset(text):
+            cached = self._numeral_mask(text, font)
+        else:
+            cached = self._text_mask(text, font)
+        if cached is None:
+            return
+        mask, (left, top) = cached
+        image.paste(0, (position[0] + left, position[1] + top), mask)
@@ -0,0 +1,193 @@
+"""
+Widget layout of the dashboard.
+Every widget owns a box of the canvas and renders into a tile of that size.
+Tiles are cached with a hash of the widget's input data: a refresh only
+rasterises the widgets whose data changed and composes their boxes into the
+previous canvas, e.g. an hourly tick only redraws the hourly table.
+Tiles are combined with a logical AND (black wins), so overlapping boxes look
+the same as drawing everything onto one canvas.
+"""
+from PIL import Image, ImageChops
+
+def _intersection(box, other):
+    """Return the intersection of two boxes, or None if they don't overlap."""
+    x_start, y_start = max(box[0], other[0]), max(box[1], other[1])
+    x_end, y_end = min(box[2], other[2]), min(box[3], other[3])
+    if x_start >= x_end or y_start >= y_end:
+        return None
+    return (x_start, y_start, x_end, y_end)
+
+def _shift(box, x_offset, y_offset):
+    """Move a box by an offset."""
+    return (box[0] + x_offset, box[1] + y_offset, box[2] + x_offset, box[3] + y_offset)
+
+class Widget:
+    """
+    A rectangular part of the dashboard. Subclasses implement draw() with
+    coordinates relative to the top left corner of the box.
+    """
+    def __init__(self, name, box):
+        self.name = name
+        # (x_start, y_start, x_end, y_end) on the canvas
+        self.box = box
+
+    @property
+    def size(self):
+        """Width and height of the tile."""
+        return (self.box[2] - self.box[0], self.box[3] - self.box[1])
+
+    def draw(self, tile, data, context):
+        """
+        Draws the data into the tile. context holds the fonts, the icon atlas and
+        the text renderer (see text_cache.py).
+        """
+        raise NotImplementedError
+
+    def render(self, data, context):
+        """Returns a new mode '1' tile with the data drawn into it."""
+        tile = Image.new('1', self.size, 255)
+        self.draw(tile, data, context)
+        return tile
+
+class LabelsWidget(Widget):
+    """
+    Static text, data is not used.
+    labels is a list of ((x, y), text, font name).
+    """
+    def __init__(self, name, box, labels):
+        super().__init__(name, box)
+        self.labels = labels
+
+    def draw(self, tile, data, context):
+        for position, text, font in self.labels:
+            context['text'].draw(tile, position, text, context[font])
+
+class HeaderWidget(Widget):
+    """
+    Current date, today's temperature range and the marker of an old forecast.
+    data: (date text, min/max text, marker text or None)
+    """
+    def draw(self, tile, data, context):
+        date_text, min_max_text, marker = data
+        context['text'].draw(tile, (10, 10), date_text, context['font'])
+        if marker:
+            context['text'].draw(tile, (10, 42), marker, context['font_small'])
+        context['text'].draw(tile, (10, 70), 'Temp min/max', context['font'])
+        context['text'].draw(tile, (230, 70), min_max_text, context['font'])
+
+class HourlyTableWidget(Widget):
+    """
+    One column per hour with time, weather icon and values.
+    data: tuple of (time text, icon name, tuple of value texts)
+    """
+    def __init__(self, name, box, column_width=110, row_height=40):
+        super().__init__(name, box)
+        self.column_width = column_width
+        self.row_height = row_height
+
+    def draw(self, tile, data, context):
+        font = context['font']
+        icons = context['atlas'].icons([icon_name for _, icon_name, _ in data])
+        for column, (time_text, _, values) in enumerate(data):
+            x_offset = column * self.column_width
+            context['text'].draw(tile, (x_offset, 10), time_text, font)
+            tile.paste(icons[column], (x_offset + 10, 45))
+            y_offset = 110
+            for value in values:
+                # short values are moved right to line up with the longer ones
+                x_value = x_offset + 10 if len(value) > 3 else x_offset + 26
+                context['text'].draw(tile, (x_value, y_offset), value, font)
+                y_offset += self.row_height
+
+class DailyOutlookWidget(Widget):
+    """
+    Temperature range, precipitation sum and description of the next days.
+    data: tuple of (day name, min/max text, precipitation text, description)
+    """
+    def __init__(self, name, box, column_width=150, line_height=20):
+        super().__init__(name, box)
+        self.column_width = column_width
+        self.line_height = line_height
+
+    def draw(self, tile, data, context):
+        font_small = context['font_small']
+        for line, label in enumerate(['Temp min/max', 'N-Summe', 'Beschreibung']):
+            context['text'].draw(tile, (10, (line + 1) * self.line_height), label, font_small)
+        for column, texts in enumerate(data):
+            x_offset = 180 + column * self.column_width
+            for line, text in enumerate(texts):
+                context['text'].draw(tile, (x_offset, line * self.line_height), text, font_small)
+
+class TrashWidget(Widget):
+    """
+    Waste collections of today and tomorrow.
+    data: tuple of (is today, summary)
+    """
+    def draw(self, tile, data, context):
+        y_offset = 0
+        for is_today, summary in data:
+            if is_today:
+                text, position = f'Heute: {summary}', (0, y_offset)
+            else:
+                text, position = f'Morgen: {summary}', (0, y_offset + 20)
+            context['text'].draw(tile, position, text, context['font_small'])
+            y_offset += 20
+
+class ListWidget(Widget):
+    """
+    A list of lines, e.g. the birthdays.
+    data: tuple of texts
+    """
+    def __init__(self, name, box, line_height=20):
+        super().__init__(name, box)
+        self.line_height = line_height
+
+    def draw(self, tile, data, context):
+        for line, text in enumerate(data):
+            context['text'].draw(tile, (0, line * self.line_height), text, context['font_small'])
+
+class Layout:
+    """
+    Composes the tiles of its widgets into one canvas, see module docstring.
+    """
+    def __init__(self, size, widgets):
+        self.size = size
+        self.widgets = widgets
+        # widget name -> (hash of the input data, tile)
+        self._tiles = {}
+        self._canvas = None
+
+    def _compose(self, region):
+        """Composes all tiles overlapping a region of the canvas again."""
+        part = Image.new('1', (region[2] - region[0], region[3] - region[1]), 255)
+        for widget in self.widgets:
+            overlap = _intersection(widget.box, region)
+            if overlap is None:
+                continue
+            tile = self._tiles[widget.name][1].crop(_shift(overlap, -widget.box[0], -widget.box[1]))
+            target = _shift(overlap, -region[0], -region[1])
+            part.paste(ImageChops.logical_and(part.crop(target), tile), target[:2])
+        self._canvas.paste(part, region[:2])
+
+    def render(self, data, context):
+        """
+        Renders the widgets. data maps widget names to their input data (plain,
+        repr-able values), context holds the fonts, the icon atlas and the text renderer.
+        Returns the canvas and the names of the widgets which were rasterised again.
+        """
+        changed = []
+        for widget in self.widgets:
+            widget_data = data.get(widget.name)
+            key = hash(repr(widget_data))
+            cached = self._tiles.get(widget.name)
+            if cached is None or cached[0] != key:
+                self._tiles[widget.name] = (key, widget.render(widget_data, context))
+                changed.append(widget)
+
+        if self._canvas is None:
+            self._canvas = Image.new('1', self.size, 255)
+            self._compose((0, 0) + tuple(self.size))
+        else:
+            for widget in changed:
+                self._compose(_intersection(widget.box, (0, 0) + tuple(self.size)))
+        return self._canvas.copy(), [widget.name for widget in changed]
@@ -0,0 +1,159 @@
+"""
+Lightweight instrumentation of the refresh.
+Code records spans (timed stages such as fetch, parse, render or transfer)
+and counters (cache hits, retries, kinds of refresh). Nothing is recorded
+until configure() is called: span() then returns a shared no-op context
+manager and count() returns right away.
+When enabled, every span and counter is appended as one JSON line to a
+rotating log file, and flush() writes the totals in the Prometheus text
+format, e.g. for the textfile collector of the node exporter.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+# Rotation of the JSONL file
+MAX_BYTES = 1024 * 1024
+BACKUP_COUNT = 3
+
+PROMETHEUS_PREFIX = 'dashboard'
+
+_enabled = False
+_logger = None
+_jsonl_path = None
+_prometheus_path = None
+_lock = threading.Lock()
+# (name, labels) -> value
+_counters = {}
+# (name, labels) -> [count, sum of seconds, last seconds]
+_spans = {}
+
+class _NoopSpan:
+    """Span used while instrumentation is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    """Measures the wall time of a with block."""
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        key = (self.name, tuple(sorted(self.labels.items())))
+        with _lock:
+            totals = _spans.setdefault(key, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = seconds
+        _write({'type': 'span', 'name': self.name, 'seconds': round(seconds, 6),
+                'error': exc_type.__name__ if exc_type else None, 'labels': self.labels})
+        return False
+
+def configure(jsonl_path=None, prometheus_path=None):
+    """
+    Enable the instrumentation if at least one of the paths is set, disable it otherwise.
+    Calling it again with the same paths does nothing, so it can be called on every refresh.
+    """
+    global _enabled, _logger, _jsonl_path, _prometheus_path
+    if (jsonl_path, prometheus_path) == (_jsonl_path, _prometheus_path):
+        return
+    if _logger is not None:
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+            handler.close()
+    _logger = None
+    if jsonl_path:
+        os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+        _logger = logging.getLogger('instrumentation')
+        _logger.propagate = False
+        _logger.setLevel(logging.INFO)
+        _logger.addHandler(logging.handlers.RotatingFileHandler(
+            jsonl_path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8'))
+    _jsonl_path = jsonl_path
+    _prometheus_path = prometheus_path
+    _enabled = bool(jsonl_path or prometheus_path)
+
+def enabled():
+    """Return whether the instrumentation is enabled."""
+    return _enabled
+
+def _write(record):
+    """Append a record to the JSONL file."""
+    if _logger is not None:
+        record['ts'] = round(time.time(), 3)
+        record['pid'] = os.getpid()
+        _logger.info(json.dumps(record))
+
+def span(name, **labels):
+    """
+    Return a context manager which records the wall time of its block, e.g.
+    `with metrics.span('fetch', source='open-meteo'):`.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+def count(name, value=1, **labels):
+    """Add value to a counter, e.g. `metrics.count('forecast_cache', result='hit')`."""
+    if not _enabled or not value:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _write({'type': 'counter', 'name': name, 'value': value, 'labels': labels})
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    text = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for key, value in labels)
+    return '{' + text + '}'
+
+def prometheus_text():
+    """Return the counters and span totals in the Prometheus text format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        spans = sorted(_spans.items())
+    for name in sorted({name for (name, _), _ in counters}):
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name}_total counter')
+        lines += [f'{PROMETHEUS_PREFIX}_{name}_total{_format_labels(labels)} {value}'
+                  for (counter_name, labels), value in counters if counter_name == name]
+    if spans:
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_span_seconds summary')
+        for (name, labels), (number, total, _) in spans:
+            labels = _format_labels((('span', name),) + labels)
+            lines.append(f'{PROMETHEUS_PREFIX}_span_seconds_count{labels} {number}')
+            lines.append(f'{PROMETHEUS_PREFIX}_span_seconds_sum{labels} {total:.6f}')
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_span_last_seconds gauge')
+        for (name, labels), (_, _, last) in spans:
+            labels = _format_labels((('span', name),) + labels)
+            lines.append(f'{PROMETHEUS_PREFIX}_span_last_seconds{labels} {last:.6f}')
+    return '\n'.join(lines) + '\n'
+
+def flush():
+    """Write the Prometheus textfile, call it at the end of a refresh."""
+    if not _enabled or not _prometheus_path:
+        return
+    tmp_path = _prometheus_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(prometheus_text())
+        os.replace(tmp_path, _prometheus_path)
+    except OSError as e:
+        print(f"Error writing metrics: {e}")
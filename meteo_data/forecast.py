@@ -0,0 +1,81 @@
+"""
+Compact, array-backed forecast container.
+An alternative to the pandas DataFrames of OpenMeteoWeather for the few dozen
+rows of a forecast: the values stay in the numpy array they were decoded or
+memory mapped into, and pandas doesn't need to be imported at all.
+"""
+from datetime import datetime, timezone
+
+class ForecastTable:
+    """
+    Forecast values on a regular time axis, one row of values per variable.
+    """
+    __slots__ = ('start', 'interval', 'columns', 'values')
+
+    def __init__(self, block, columns):
+        self.start = int(block.time)
+        self.interval = int(block.interval)
+        self.columns = list(columns)
+        self.values = block.values
+
+    def __len__(self):
+        return self.values.shape[1]
+
+    def time(self, position):
+        """Return the (UTC) time of a position."""
+        return datetime.fromtimestamp(self.start + position * self.interval, tz=timezone.utc)
+
+    def position(self, when):
+        """
+        Return the position of a timezone aware datetime, or None if it isn't
+        a time step of the table.
+        """
+        offset = int(when.timestamp()) - self.start
+        position, remainder = divmod(offset, self.interval)
+        if remainder or not 0 <= position < len(self):
+            return None
+        return position
+
+    def column(self, name):
+        """Return the values of a variable as a numpy array."""
+        return self.values[self.columns.index(name)]
+
+    def row(self, position):
+        """Return the values of all variables at a position."""
+        return ForecastRow(self, position)
+
+    def rows(self, start=None, end=None):
+        """Yield the rows with start <= time <= end."""
+        for position in range(len(self)):
+            when = self.time(position)
+            if (start is None or when >= start) and (end is None or when <= end):
+                yield ForecastRow(self, position)
+
+class ForecastRow:
+    """
+    The values of all variables at one time step of a ForecastTable.
+    """
+    __slots__ = ('table', 'position')
+
+    def __init__(self, table, position):
+        self.table = table
+        self.position = position
+
+    def __len__(self):
+        return len(self.table.columns)
+
+    def __getitem__(self, key):
+        """Return a value by variable name or by column number."""
+        if isinstance(key, str):
+            key = self.table.columns.index(key)
+        return self.table.values[key, self.position]
+
+    @property
+    def time(self):
+        """The (UTC) time of the row."""
+        return self.table.time(self.position)
+
+    @property
+    def values(self):
+        """The values of all variables as a numpy array."""
+        return self.table.values[:, self.position]
@@ -0,0 +1,178 @@
+"""
+Cache for decoded forecast arrays.
+Forecasts are stored per location and variable set as .npy files which are
+memory mapped when read, so a cache hit neither touches the network nor
+decodes a response again. Entries expire when the next model run is expected
+and are fetched again by the refresh that finds them expired. Only if that
+fails (network down, circuit open, deadline passed) is the expired forecast
+served, while a background thread keeps trying (stale-while-revalidate).
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from instrumentation import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "forecast_cache")
+
+# Open-Meteo updates its forecasts every hour, a new run is available a few
+# minutes after the full hour
+MODEL_UPDATE_INTERVAL = 3600
+MODEL_UPDATE_DELAY = 600
+
+# Time axis and values (one row per variable) of the hourly or daily part of a forecast
+ForecastBlock = collections.namedtuple('ForecastBlock', ['time', 'time_end', 'interval', 'values'])
+
+def cache_key(latitude, longitude, *variable_lists):
+    """Return the cache key of a location and the requested variables."""
+    text = json.dumps([round(latitude, 4), round(longitude, 4), variable_lists])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def next_model_update(timestamp, interval=MODEL_UPDATE_INTERVAL, delay=MODEL_UPDATE_DELAY):
+    """Return the time at which the model run following timestamp is expected."""
+    return ((timestamp - delay) // interval + 1) * interval + delay
+
+class ForecastCache:
+    """
+    Stores forecasts, i.e. dicts of block name -> ForecastBlock, on disk.
+    """
+    def __init__(self, directory=CACHE_DIR, update_interval=MODEL_UPDATE_INTERVAL,
+                 update_delay=MODEL_UPDATE_DELAY):
+        self.directory = directory
+        self.update_interval = update_interval
+        self.update_delay = update_delay
+        self._lock = threading.Lock()
+        self._revalidating = set()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """
+        Load a cached forecast. Returns (forecast, expires_at) or (None, 0)
+        if there is no entry. The values are memory mapped.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'meta.json'), 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            forecast = {
+                name: ForecastBlock(block['time'], block['time_end'], block['interval'],
+                                    np.load(os.path.join(entry_dir, f'{name}.npy'),
+                                            mmap_mode='r'))
+                for name, block in meta['blocks'].items()
+            }
+        except (OSError, ValueError, KeyError):
+            return None, 0
+        return forecast, meta['expires_at']
+
+    def fetched_at(self, key):
+        """
+        Return the time a cached forecast was fetched, or None if there is no entry.
+        An old value means the forecast could not be refreshed for a while.
+        """
+        try:
+            with open(os.path.join(self._entry_dir(key), 'meta.json'), 'r', encoding='utf-8') as file:
+                return json.load(file)['fetched_at']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, key, forecast, fetched_at=None):
+        """Store a forecast, it expires with the next model run."""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        meta = {
+            'fetched_at': fetched_at,
+            'expires_at': next_model_update(fetched_at, self.update_interval,
+                                            self.update_delay),
+            'blocks': {}
+        }
+        for name, block in forecast.items():
+            tmp_path = os.path.join(entry_dir, f'{name}.tmp.npy')
+            np.save(tmp_path, np.asarray(block.values, dtype=np.float32))
+            os.replace(tmp_path, os.path.join(entry_dir, f'{name}.npy'))
+            meta['blocks'][name] = {'time': int(block.time), 'time_end': int(block.time_end),
+                                    'interval': int(block.interval)}
+        # meta.json is written last, an entry is only visible once it is complete
+        tmp_path = os.path.join(entry_dir, 'meta.tmp.json')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, os.path.join(entry_dir, 'meta.json'))
+
+    def get(self, key, fetch, revalidate=None):
+        """
+        Return the forecast for key. fetch() is called to retrieve a new forecast,
+        revalidate() (default: fetch) by the background thread, see get_many.
+        """
+        revalidate = revalidate or fetch
+        return self.get_many([key], lambda keys: [fetch()], lambda keys: [revalidate()])[0]
+
+    def get_many(self, keys, fetch_many, revalidate_many=None):
+        """
+        Return the forecasts for several keys.
+        fetch_many(keys) must return the forecasts of the given keys in one go.
+        Missing and expired forecasts are fetched together right away. If that
+        fails and all of them are only expired, the expired forecasts are
+        returned as they are and fetched again in the background with
+        revalidate_many (default: fetch_many), e.g. one with a short deadline
+        of its own instead of the one of the refresh. Otherwise the error is raised.
+        """
+        now = time.time()
+        forecasts = []
+        missing = []
+        expired = []
+        for key in keys:
+            forecast, expires_at = self.load(key)
+            if forecast is None:
+                missing.append(key)
+            elif expires_at <= now:
+                expired.append(key)
+            forecasts.append(forecast)
+        metrics.count('forecast_cache', len(missing), result='miss')
+        metrics.count('forecast_cache', len(expired), result='expired')
+        metrics.count('forecast_cache', len(keys) - len(missing) - len(expired), result='hit')
+        if not missing and not expired:
+            return forecasts
+
+        try:
+            fetched = dict(zip(missing + expired, fetch_many(missing + expired)))
+        except Exception as e:
+            if missing:
+                raise
+            metrics.count('forecast_cache', len(expired), result='stale')
+            print(f"Error refreshing cached forecast, showing the expired one: {e}")
+            self._revalidate(expired, revalidate_many or fetch_many)
+            return forecasts
+        for key, forecast in fetched.items():
+            self.store(key, forecast)
+        return [fetched.get(key, forecast) for key, forecast in zip(keys, forecasts)]
+
+    def _revalidate(self, keys, fetch_many):
+        """Fetch expired forecasts in a background thread, unless already in progress."""
+        with self._lock:
+            keys = [key for key in keys if key not in self._revalidating]
+            self._revalidating.update(keys)
+        if not keys:
+            return
+
+        def revalidate():
+            try:
+                for key, forecast in zip(keys, fetch_many(keys)):
+                    self.store(key, forecast)
+            except Exception as e:
+                # keep serving the stale forecast, the next call tries again
+                metrics.count('forecast_revalidate_errors')
+                print(f"Error refreshing cached forecast: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.difference_update(keys)
+
+        # not a daemon thread, a short-lived process still finishes the
+        # refresh after it has drawn with the stale forecast, fetch_many
+        # should bound its time
+        threading.Thread(target=revalidate, name='forecast-revalidate').start()
@@ -2,23 +2,188 @@
 Open-Meteo API client for weather data retrieval and processing.
 This module provides a class to interact
 with the Open-Meteo API, retrieve weather data, and process it into a structured format.
+pandas, PIL and the HTTP client libraries are only imported when they are needed,
+so a refresh served from the forecast cache as ForecastTables doesn't import them.
 """
-import openmeteo_requests
-import requests_cache
-import pandas as pd
-from retry_requests import retry
-from PIL import Image
+import functools
+import numpy as np
+from instrumentation import metrics
+from . import resilience
+from .forecast import ForecastTable
+from .forecast_cache import ForecastBlock, ForecastCache, cache_key
 
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+# Name of the source for the circuit breaker, see resilience.py
+SOURCE = "open-meteo"
+
+# Seconds a background revalidation of expired forecasts may take, so a
+# one-shot run doesn't wait long for it after drawing
+REVALIDATE_DEADLINE = resilience.REQUEST_TIMEOUT
+
+# Open-Meteo accepts lists of coordinates, this many are sent in one request
+MAX_LOCATIONS_PER_REQUEST = 50
+
+# Variables requested from the API and the matching dataframe columns, in the same order
+HOURLY_VARIABLES = ["temperature_2m", "apparent_temperature", "relative_humidity_2m",
+                    "precipitation", "precipitation_probability", "uv_index",
+                    "weather_code", "is_day"]
+HOURLY_COLUMNS = ["temperature_2m", "temperature_apparent", "relative_humidity_2m",
+                  "precipitation", "precipitation_probability", "uv_index",
+                  "weather_code", "is_day"]
+DAILY_VARIABLES = ["temperature_2m_min", "temperature_2m_max",
+                   "weather_code", "precipitation_sum"]
+
+# WMO weather codes range from 0 to 99
+WEATHER_CODE_COUNT = 100
+# Description of weather codes without a translation
+UNKNOWN_DESCRIPTION = "Unknown"
+# Size of the weather icons on the display
+ICON_SIZE = (50, 50)
+
+def create_client():
+    """
+    Setup the Open-Meteo API client.
+    Failed requests are retried within the deadline of the refresh by
+    resilience.call, responses are cached decoded by ForecastCache, not as raw HTTP bodies.
+    """
+    import openmeteo_requests
+    import requests
+    return openmeteo_requests.Client(session=requests.Session())
+
+@functools.lru_cache(maxsize=1)
+def get_client():
+    """Return the shared Open-Meteo API client, it is created on first use."""
+    return create_client()
+
+@functools.lru_cache(maxsize=8)
+def _date_range(time, time_end, interval):
+    """
+    Build a time index. All locations of a batch share the same time axis,
+    so the index is built once and reused.
+    """
+    import pandas as pd
+    return pd.date_range(
+        start=pd.to_datetime(time, unit="s", utc=True),
+        end=pd.to_datetime(time_end, unit="s", utc=True),
+        freq=pd.Timedelta(seconds=interval),
+        inclusive="left",
+        name="date"
+    )
+
+def decode_block(data):
+    """Decode the hourly or daily part of an API response into a ForecastBlock."""
+    values = np.stack([data.Variables(i).ValuesAsNumpy()
+                       for i in range(data.VariablesLength())])
+    return ForecastBlock(data.Time(), data.TimeEnd(), data.Interval(), values)
+
+def block_to_dataframe(block, columns):
+    """Build a dataframe with a time index from a ForecastBlock."""
+    import pandas as pd
+    data = {column: block.values[i] for i, column in enumerate(columns)}
+    return pd.DataFrame(data=data,
+                        index=_date_range(block.time, block.time_end, block.interval))
+
+def decode_hourly(response):
+    """Decode the hourly block of an API response into a dataframe."""
+    return block_to_dataframe(decode_block(response.Hourly()), HOURLY_COLUMNS)
+
+def decode_daily(response):
+    """Decode the daily block of an API response into a dataframe."""
+    return block_to_dataframe(decode_block(response.Daily()), DAILY_VARIABLES)
+
+def forecast_key(latitude, longitude):
+    """Return the ForecastCache key of the forecast of a location."""
+    return cache_key(latitude, longitude, HOURLY_VARIABLES, DAILY_VARIABLES)
+
+def fetch_forecast_blocks(locations, openmeteo=None, url=FORECAST_URL, deadline=None,
+                          count_failures=True):
+    """
+    Retrieve hourly and daily weather data for several locations.
+    locations is a list of (latitude, longitude) tuples. The coordinates are sent
+    as comma separated lists, so up to MAX_LOCATIONS_PER_REQUEST locations cost one request.
+    Requests are retried until the deadline (see resilience.py) has passed,
+    count_failures is passed on to resilience.call.
+    Returns a list of {'hourly': ForecastBlock, 'daily': ForecastBlock}
+    in the order of the locations.
+    """
+    openmeteo = openmeteo or get_client()
+    forecasts = []
+    for i in range(0, len(locations), MAX_LOCATIONS_PER_REQUEST):
+        batch = locations[i:i + MAX_LOCATIONS_PER_REQUEST]
+        params = {
+            "latitude": ",".join(str(latitude) for latitude, _ in batch),
+            "longitude": ",".join(str(longitude) for _, longitude in batch),
+            "hourly": HOURLY_VARIABLES,
+            "daily": DAILY_VARIABLES,
+            "forecast_days": 3,
+        }
+        with metrics.span('fetch'):
+            responses = resilience.call(
+                lambda timeout: openmeteo.weather_api(url, params=params, timeout=timeout),
+                SOURCE, deadline, count_failures=count_failures)
+        if len(responses) != len(batch):
+            raise ValueError(f"Expected {len(batch)} responses, got {len(responses)}")
+        with metrics.span('decode'):
+            forecasts += [{'hourly': decode_block(response.Hourly()),
+                           'daily': decode_block(response.Daily())}
+                          for response in responses]
+    return forecasts
+
+def _fetch_forecast_blocks_cached(locations, openmeteo, url, cache, deadline):
+    """
+    Return the forecasts of several locations, with a ForecastCache only the
+    locations without a current cached forecast are fetched. If that fails,
+    expired forecasts are fetched again in the background within
+    REVALIDATE_DEADLINE. That failure was already counted by the circuit
+    breaker, the background attempt doesn't count again.
+    """
+    if cache is None:
+        return fetch_forecast_blocks(locations, openmeteo, url, deadline)
+    keys = [forecast_key(latitude, longitude) for latitude, longitude in locations]
+    locations_by_key = dict(zip(keys, locations))
+    return cache.get_many(
+        keys,
+        lambda missing: fetch_forecast_blocks([locations_by_key[key] for key in missing],
+                                              openmeteo, url, deadline),
+        lambda expired: fetch_forecast_blocks([locations_by_key[key] for key in expired],
+                                              openmeteo, url,
+                                              resilience.Deadline(REVALIDATE_DEADLINE),
+                                              count_failures=False))
+
+def fetch_forecasts(locations, openmeteo=None, url=FORECAST_URL, cache=None, deadline=None):
+    """
+    Retrieve hourly and daily weather data for several locations in as few
+    requests as possible, see fetch_forecast_blocks.
+    With a ForecastCache only the locations without a cached forecast are fetched,
+    the requests give up once the deadline (see resilience.py) has passed.
+    Returns a list of (hourly_dataframe, daily_dataframe) in the order of the locations.
+    """
+    return [(block_to_dataframe(forecast['hourly'], HOURLY_COLUMNS),
+             block_to_dataframe(forecast['daily'], DAILY_VARIABLES))
+            for forecast in _fetch_forecast_blocks_cached(locations, openmeteo, url, cache,
+                                                          deadline)]
+
+def fetch_forecast_tables(locations, openmeteo=None, url=FORECAST_URL, cache=None,
+                          deadline=None):
+    """
+    Same as fetch_forecasts, but returns lightweight ForecastTables instead of
+    dataframes, pandas is not needed.
+    Returns a list of (hourly_table, daily_table) in the order of the locations.
+    """
+    return [(ForecastTable(forecast['hourly'], HOURLY_COLUMNS),
+             ForecastTable(forecast['daily'], DAILY_VARIABLES))
+            for forecast in _fetch_forecast_blocks_cached(locations, openmeteo, url, cache,
+                                                          deadline)]
 
 class OpenMeteoWeather:
     """
     A class to interact with the Open-Meteo API for weather data retrieval.
     """
-    def __init__(self, latitude, longitude):
-        # Setup the Open-Meteo API client with cache and retry on error
-        cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        self.openmeteo = openmeteo_requests.Client(session=retry_session)
+    def __init__(self, latitude, longitude, cache=None):
+        # Open-Meteo API client with retry on error, the shared client is created on first use
+        self.openmeteo = None
+        # Decoded forecasts are cached on disk
+        self.cache = ForecastCache() if cache is None else cache
 
         # Dictionary to store weather code translations
         self.weather_code_translations = {
@@ -74,98 +239,105 @@ class OpenMeteoWeather:
             ((45,48,51,53,55,56,57), False): "50n"
         }
 
-        self.url = "https://api.open-meteo.com/v1/forecast"
+        # Dense lookup tables indexed by weather code (and is_day), built once from the dicts.
+        # Index 0 of the name arrays is used for codes without an icon or translation.
+        self.icon_name_array = np.array([None] + sorted(set(self.weather_icons.values())),
+                                        dtype=object)
+        self.icon_table = np.zeros((WEATHER_CODE_COUNT, 2), dtype=np.intp)
+        for (codes, is_day), icon_name in self.weather_icons.items():
+            codes = codes if isinstance(codes, tuple) else (codes,)
+            self.icon_table[list(codes), int(is_day)] = list(self.icon_name_array).index(icon_name)
+
+        self.description_array = np.array([UNKNOWN_DESCRIPTION] +
+                                          list(self.weather_code_translations.values()),
+                                          dtype=object)
+        self.description_table = np.zeros(WEATHER_CODE_COUNT, dtype=np.intp)
+        self.description_table[list(self.weather_code_translations)] = np.arange(
+            1, len(self.weather_code_translations) + 1)
+
+        self.url = FORECAST_URL
 
         self.latitude = latitude
         self.longitude = longitude
 
+        # Last fetched (hourly_dataframe, daily_dataframe)
+        self.forecast = None
+
+    def fetch_forecast(self, deadline=None):
+        """
+        Retrieve hourly and daily weather data for the specified latitude and longitude
+        with a single request. Both come from the same model run.
+        A current cached forecast is returned without waiting on the network.
+        Returns a tuple (hourly_dataframe, daily_dataframe).
+        """
+        self.forecast = fetch_forecasts([(self.latitude, self.longitude)],
+                                        self.openmeteo, self.url, self.cache, deadline)[0]
+        return self.forecast
+
+    def fetch_forecast_tables(self, deadline=None):
+        """
+        Same as fetch_forecast, but returns lightweight ForecastTables instead of dataframes.
+        Returns a tuple (hourly_table, daily_table).
+        """
+        return fetch_forecast_tables([(self.latitude, self.longitude)],
+                                     self.openmeteo, self.url, self.cache, deadline)[0]
+
+    def fetched_at(self):
+        """
+        Return the time (seconds since the epoch) the cached forecast was fetched,
+        or None if there is none.
+        """
+        return self.cache.fetched_at(forecast_key(self.latitude, self.longitude))
+
     def get_weather_hourly(self):
         """
         Retrieve hourly weather data for the specified latitude and longitude.
+        Fetched on every call, a current cached forecast is returned without a request.
         """
-        params = {
-            "latitude": self.latitude,
-            "longitude": self.longitude,
-            "hourly": ["temperature_2m", "apparent_temperature", "relative_humidity_2m",
-                        "precipitation", "precipitation_probability", "uv_index",
-                        "weather_code", "is_day"],
-            "forecast_days": 1,
-        }
-        responses = self.openmeteo.weather_api(self.url, params=params)
-
-        response = responses[0]
-        hourly = response.Hourly()
-        hourly_data = {
-            "date": pd.date_range(
-                start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
-                end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
-                freq=pd.Timedelta(seconds=hourly.Interval()),
-                inclusive="left"
-            ),
-            "temperature_2m": hourly.Variables(0).ValuesAsNumpy(),
-            "temperature_apparent": hourly.Variables(1).ValuesAsNumpy(),
-            "relative_humidity_2m": hourly.Variables(2).ValuesAsNumpy(),
-            "precipitation": hourly.Variables(3).ValuesAsNumpy(),
-            "precipitation_probability": hourly.Variables(4).ValuesAsNumpy(),
-            "uv_index": hourly.Variables(5).ValuesAsNumpy(),
-            "weather_code": hourly.Variables(6).ValuesAsNumpy(),
-            "is_day": hourly.Variables(7).ValuesAsNumpy()
-        }
-
-        hourly_dataframe = pd.DataFrame(data=hourly_data)
-        hourly_dataframe.set_index('date', inplace=True)
-        return hourly_dataframe
+        return self.fetch_forecast()[0]
 
     def get_weather_daily(self):
         """
         Retrieve daily weather data for the specified latitude and longitude.
+        Fetched on every call, a current cached forecast is returned without a request.
         """
-        params = {
-            "latitude": self.latitude,
-            "longitude": self.longitude,
-            "daily": ["temperature_2m_min", "temperature_2m_max", 
-                      "weather_code", "precipitation_sum"],
-            "forecast_days": 3,
-        }
-        responses = self.openmeteo.weather_api(self.url, params=params)
-
-        response = responses[0]
-        daily = response.Daily()
-        daily_data = {
-            "date": pd.date_range(
-                start=pd.to_datetime(daily.Time(), unit="s", utc=True),
-                end=pd.to_datetime(daily.TimeEnd(), unit="s", utc=True),
-                freq=pd.Timedelta(seconds=daily.Interval()),
-                inclusive="left"
-            ),
-            "temperature_2m_min": daily.Variables(0).ValuesAsNumpy(),
-            "temperature_2m_max": daily.Variables(1).ValuesAsNumpy(),
-            "weather_code": daily.Variables(2).ValuesAsNumpy(),
-            "precipitation_sum": daily.Variables(3).ValuesAsNumpy(),
-        }
+        return self.fetch_forecast()[1]
+
+    @staticmethod
+    def _code_indices(codes):
+        """
+        Convert weather codes to table indices. Codes outside the table
+        (and missing values) are mapped to -1.
+        """
+        codes = np.asarray(codes, dtype=float)
+        valid = np.isfinite(codes) & (codes >= 0) & (codes < WEATHER_CODE_COUNT)
+        return np.where(valid, np.nan_to_num(codes), -1).astype(np.intp)
 
-        daily_dataframe = pd.DataFrame(data=daily_data)
-        daily_dataframe.set_index('date', inplace=True)
-        return daily_dataframe
+    def icon_names(self, codes, is_day):
+        """
+        Get the icon names of a whole column of weather codes and day/night flags.
+        Codes without an icon are mapped to None.
+        """
+        indices = self._code_indices(codes)
+        is_day = np.asarray(is_day, dtype=float) > 0
+        names = self.icon_table[indices.clip(0), is_day.astype(np.intp)]
+        return self.icon_name_array[np.where(indices >= 0, names, 0)]
+
+    def descriptions(self, codes):
+        """
+        Get the descriptions of a whole column of weather codes.
+        Codes without a translation are mapped to UNKNOWN_DESCRIPTION.
+        """
+        indices = self._code_indices(codes)
+        descriptions = self.description_table[indices.clip(0)]
+        return self.description_array[np.where(indices >= 0, descriptions, 0)]
 
     def get_icon(self, weather_code, is_day):
         """
         Get the icon number based on weather code and day/night status.
+        Returns None for weather codes without an icon.
         """
-        iconnr = None
-
-        for key, value in self.weather_icons.items():
-            if isinstance(key[0], tuple):
-                # Check if weather_code is in the tuple
-                if weather_code in key[0] and is_day == key[1]:
-                    iconnr = value
-                    break
-            else:
-                # Check if weather_code is equal to the single value
-                if weather_code == key[0] and is_day == key[1]:
-                    iconnr = value
-                    break
-        return iconnr
+        return self.icon_names([weather_code], [is_day])[0]
 
     def get_icon_url(self, weather_code, is_day):
         """
@@ -181,14 +353,19 @@ class OpenMeteoWeather:
         Get a list of images for the weather icons based on the weather dataframe.
         """
 
+        from PIL import Image
         img_list = []
-        for i, (index, row) in enumerate(weather_dataframe.iterrows()):
-            weather_code = row['weather_code']
-            is_day = row['is_day']
-            icon_name = self.get_icon(weather_code, is_day)
+        icon_names = self.icon_names(weather_dataframe['weather_code'].to_numpy(),
+                                     weather_dataframe['is_day'].to_numpy())
+        for weather_code, icon_name in zip(weather_dataframe['weather_code'], icon_names):
+            if icon_name is None:
+                # no icon for this weather code, leave the space empty
+                print(f"No weather icon for weather code {weather_code}")
+                img_list.append(Image.new('1', ICON_SIZE, 255))
+                continue
             image_path = ''.join([path_to_icon_folder,icon_name,'.bmp'])
             image = Image.open(image_path)
-            image = image.resize((50,50))
+            image = image.resize(ICON_SIZE)
             img_list.append(image)
 
         return img_list
@@ -0,0 +1,135 @@
+"""
+Bounds the time a refresh spends on the network.
+A Deadline is created per refresh and shared by all network calls of it: every
+attempt gets at most the remaining time as timeout and no retry is started
+once it has passed. A CircuitBreaker per source stops calling a source after
+repeated failures until a cool-down period has passed. Its state is stored on
+disk, so it also holds across runs of the one-shot script.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from instrumentation import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds a single attempt may take at most
+REQUEST_TIMEOUT = 10
+# Attempts per call and the delay before the first retry (doubled for every further retry)
+ATTEMPTS = 3
+BACKOFF = 0.5
+# A source is skipped for COOL_DOWN seconds after FAILURE_THRESHOLD failed calls in a row
+FAILURE_THRESHOLD = 3
+COOL_DOWN = 15 * 60
+
+class DeadlineExceeded(Exception):
+    """The time budget of the refresh is used up."""
+
+class CircuitOpen(Exception):
+    """The source failed repeatedly and is skipped during its cool-down."""
+
+class Deadline:
+    """
+    Time budget of a refresh, shared by all its network calls.
+    """
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left, 0 once the deadline has passed."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """Return whether the deadline has passed."""
+        return self.remaining() <= 0
+
+class CircuitBreaker:
+    """
+    Counts the failed calls of a source in a row. After failure_threshold of
+    them the circuit is open: calls are refused until cool_down seconds have
+    passed, then one call is let through to probe the source.
+    """
+    def __init__(self, path, failure_threshold=FAILURE_THRESHOLD, cool_down=COOL_DOWN):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self._lock = threading.Lock()
+        self.failures, self.opened_at = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            return state['failures'], state['opened_at']
+        except (OSError, ValueError, KeyError):
+            return 0, None
+
+    def _store(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'failures': self.failures, 'opened_at': self.opened_at}, file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error storing the circuit breaker state: {e}")
+
+    def is_open(self):
+        """Return whether calls are refused at the moment."""
+        with self._lock:
+            return self.opened_at is not None and time.time() - self.opened_at < self.cool_down
+
+    def record_success(self):
+        """Close the circuit again."""
+        with self._lock:
+            if self.failures or self.opened_at is not None:
+                self.failures, self.opened_at = 0, None
+                self._store()
+
+    def record_failure(self):
+        """Count a failed call, the circuit opens (again) at the threshold."""
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+            self._store()
+
+@functools.lru_cache(maxsize=None)
+def get_breaker(source):
+    """Return the shared circuit breaker of a source, e.g. 'open-meteo'."""
+    return CircuitBreaker(os.path.join(BASE_DIR, f'breaker_{source}.json'))
+
+def call(function, source, deadline=None, attempts=ATTEMPTS, backoff=BACKOFF,
+         timeout=REQUEST_TIMEOUT, count_failures=True):
+    """
+    Call function(timeout) with retries. timeout is the number of seconds the
+    attempt may take, it is shortened to what is left of the deadline.
+    With count_failures=False a failed call doesn't count toward the circuit
+    breaker, e.g. a background retry of a refresh that was already counted.
+    Raises CircuitOpen if the source is in its cool-down, DeadlineExceeded if
+    the deadline passed before an attempt could be made, or the error of the
+    last attempt.
+    """
+    breaker = get_breaker(source)
+    if breaker.is_open():
+        metrics.count('circuit_open', source=source)
+        raise CircuitOpen(f"{source} failed {breaker.failures} times, skipped during the cool-down")
+    for attempt in range(attempts):
+        remaining = timeout if deadline is None else min(timeout, deadline.remaining())
+        if remaining <= 0:
+            # not counted as failure of the source
+            raise DeadlineExceeded(f"No time left for {source}")
+        try:
+            result = function(remaining)
+        except Exception:
+            delay = backoff * 2 ** attempt
+            if attempt + 1 == attempts or (deadline is not None and deadline.remaining() <= delay):
+                if count_failures:
+                    breaker.record_failure()
+                raise
+            metrics.count('http_retries', source=source)
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
@@ -0,0 +1,162 @@
+"""
+Tests of the birthday database: the schema migrations of existing databases,
+the upcoming birthdays with their ages and the CSV import.
+"""
+import io
+import sqlite3
+from datetime import datetime
+import pytest
+from birthday_push_message import database
+from birthday_push_message.database import BirthdayStore, ImportResult
+
+def names_and_dates(store):
+    return sorted((birthday.name, birthday.date) for birthday in store.all())
+
+# The table of the first version, with the stored age
+BASELINE_TABLE = """
+    CREATE TABLE birthdays (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        age INTEGER NOT NULL
+    )
+"""
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """A database of the first version. The last row was deleted, its id must not be used again."""
+    db_path = str(tmp_path / 'baseline.db')
+    connection = sqlite3.connect(db_path)
+    connection.execute(BASELINE_TABLE)
+    connection.executemany("INSERT INTO birthdays (name, date, age) VALUES (?, ?, ?)",
+                           [("Anna", "01.02.1990", 33), ("Bob", "03.04.0999", 0),
+                            ("Carl", "31.12.1980", 43)])
+    connection.execute("DELETE FROM birthdays WHERE name = 'Carl'")
+    connection.commit()
+    connection.close()
+    return db_path
+
+@pytest.fixture
+def store(tmp_path):
+    store = BirthdayStore(str(tmp_path / 'birthdays.db'))
+    yield store
+    store.close()
+
+def test_migration_of_the_baseline_schema(baseline_db):
+    store = BirthdayStore(baseline_db)
+    assert store.all(datetime(2024, 6, 1)) == [(1, "Anna", "01.02.1990", 34),
+                                               (2, "Bob", "03.04.0999", None)]
+    # the id of the deleted row isn't used again
+    assert store.add("Dora", "05.06.2000") == 4
+    store.close()
+    connection = sqlite3.connect(baseline_db)
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(birthdays)")]
+    assert columns == ['id', 'name', 'date', 'month', 'day', 'year']
+    assert connection.execute("SELECT month, day, year FROM birthdays WHERE id = 1").fetchone() \
+        == (2, 1, 1990)
+    indexes = {row[1] for row in connection.execute("PRAGMA index_list(birthdays)")}
+    assert {'birthdays_month_day', 'birthdays_name_date'} <= indexes
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    connection.close()
+
+def test_migrated_database_is_opened_again(baseline_db):
+    BirthdayStore(baseline_db).close()
+    store = BirthdayStore(baseline_db)
+    assert names_and_dates(store) == [("Anna", "01.02.1990"), ("Bob", "03.04.0999")]
+    store.close()
+
+def test_migration_removes_duplicates(tmp_path):
+    # a database of schema version 2, before names were unique per date
+    db_path = str(tmp_path / 'birthdays.db')
+    connection = sqlite3.connect(db_path)
+    connection.execute(database.CREATE_TABLE.format(table='birthdays'))
+    connection.execute(database.CREATE_INDEX)
+    connection.executemany("INSERT INTO birthdays (name, date, month, day, year)"
+                           " VALUES (?, ?, ?, ?, ?)",
+                           [(name, date) + database.date_parts(date) for name, date in [
+                               ("Anna", "01.02.1990"), ("Bob", "03.04.1985"),
+                               ("Anna", "01.02.1990"), ("Anna", "01.02.1991"),
+                               ("Bob", "03.04.1985")]])
+    connection.execute("PRAGMA user_version = 2")
+    connection.commit()
+    connection.close()
+
+    store = BirthdayStore(db_path)
+    # the first of the duplicates is kept
+    assert sorted((birthday.id, birthday.name, birthday.date) for birthday in store.all()) == [
+        (1, "Anna", "01.02.1990"), (2, "Bob", "03.04.1985"), (4, "Anna", "01.02.1991")]
+    assert store.add("Anna", "01.02.1990") is None
+    store.close()
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    connection.close()
+
+def test_import_completes_the_unknown_year(store):
+    store.add("Anna", "01.02.0999")
+    assert store.import_birthdays([("Anna", "01.02.1990")]) == ImportResult(0, 1, 0)
+    assert names_and_dates(store) == [("Anna", "01.02.1990")]
+
+def test_import_skips_the_unknown_year_of_a_dated_birthday(store):
+    store.add("Anna", "01.02.1990")
+    assert store.import_birthdays([("Anna", "01.02.0999")]) == ImportResult(0, 0, 1)
+    assert names_and_dates(store) == [("Anna", "01.02.1990")]
+
+def test_import_of_duplicates_within_the_file(store):
+    rows = [("Bob", "03.04.0999"), ("Anna", "01.02.1990"), ("Bob", "03.04.1985"),
+            ("Anna", "01.02.1990"), ("Anna", "01.02.0999")]
+    assert store.import_birthdays(rows) == ImportResult(2, 0, 3)
+    assert names_and_dates(store) == [("Anna", "01.02.1990"), ("Bob", "03.04.1985")]
+
+def test_import_of_duplicates_across_chunks(store):
+    # the unknown year is inserted by the first chunk and completed by the second
+    rows = [("Bob", "03.04.0999"), ("Bob", "03.04.1985"), ("Bob", "03.04.0999")]
+    assert store.import_birthdays(rows, chunk_size=1) == ImportResult(1, 1, 1)
+    assert names_and_dates(store) == [("Bob", "03.04.1985")]
+
+def test_import_skips_invalid_rows(store):
+    csv_file = io.StringIO("Name;Day;Month;Year\n"
+                           "Anna;1;2;1990\n"
+                           ";3;4;1985\n"
+                           "Bob;32;1;1985\n"
+                           "Carl;1;13;1985\n"
+                           "Dora;x;1;1985\n"
+                           "Emil;5;6;\n")
+    assert store.import_birthdays(database.read_csv_birthdays(csv_file)) == \
+        ImportResult(2, 0, 4)
+    assert names_and_dates(store) == [("Anna", "01.02.1990"), ("Emil", "05.06.0999")]
+
+def test_import_needs_every_column():
+    with pytest.raises(KeyError):
+        list(database.read_csv_birthdays(io.StringIO("Name;Day;Month\nAnna;1;2\n")))
+
+@pytest.fixture
+def year_end_store(store):
+    for name, date in [("Anna", "30.12.1990"), ("Bob", "02.01.2000"), ("Carl", "01.01.0999"),
+                       ("Dora", "28.12.1985"), ("Emil", "04.01.1970"), ("Fritz", "15.06.1990")]:
+        store.add(name, date)
+    return store
+
+def test_upcoming_wraps_across_the_year_end(year_end_store):
+    upcoming = year_end_store.upcoming(7, datetime(2024, 12, 28))
+    # sorted by date, the ages are the ones reached on the birthday
+    assert [(birthday.name, birthday.age) for birthday in upcoming] == [
+        ("Dora", 39), ("Anna", 34), ("Carl", None), ("Bob", 25), ("Emil", 55)]
+
+def test_upcoming_within_the_year(year_end_store):
+    upcoming = year_end_store.upcoming(3, datetime(2024, 12, 28))
+    assert [(birthday.name, birthday.age) for birthday in upcoming] == [
+        ("Dora", 39), ("Anna", 34)]
+    assert [birthday.name for birthday in year_end_store.upcoming(30, datetime(2024, 6, 1))] \
+        == ["Fritz"]
+
+def test_upcoming_of_a_whole_year_matches_every_day_once(year_end_store):
+    upcoming = year_end_store.upcoming(400, datetime(2024, 6, 15))
+    assert [birthday.name for birthday in upcoming] == [
+        "Fritz", "Dora", "Anna", "Carl", "Bob", "Emil"]
+
+def test_age_on_the_birthday(year_end_store):
+    assert [(birthday.name, birthday.age)
+            for birthday in year_end_store.on_date(datetime(2025, 1, 2))] == [("Bob", 25)]
+    # one day before the birthday the age is still the previous one
+    ages = {birthday.name: birthday.age for birthday in year_end_store.all(datetime(2025, 1, 1))}
+    assert ages["Bob"] == 24 and ages["Anna"] == 34 and ages["Carl"] is None
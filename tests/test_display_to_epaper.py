@@ -0,0 +1,48 @@
+"""
+Tests of a refresh whose stages fail: the panel must be put to sleep and the
+resources closed anyway.
+"""
+import pytest
+from e_paper import display_to_epaper as dte
+from e_paper.backends import RecordingEPD
+
+def fail(*args):
+    raise ValueError("malformed DTSTART")
+
+@pytest.fixture
+def resources(tmp_path, monkeypatch):
+    monkeypatch.setattr(dte, 'fetch_weather', lambda weather, deadline: (None, None, None))
+    monkeypatch.setattr(dte.sh, 'check_and_send_birthdays', lambda *args: [])
+    resources = dte.DashboardResources(RecordingEPD(), str(tmp_path / 'last_frame.bin'))
+    # no fonts or icons needed, the refresh fails before drawing
+    monkeypatch.setattr(resources, 'load', lambda: None)
+    return resources
+
+@pytest.fixture
+def closed(resources, monkeypatch):
+    calls = []
+    monkeypatch.setattr(dte.DashboardResources, 'close', lambda self: calls.append(self))
+    return calls
+
+def test_panel_sleeps_when_a_stage_fails(resources, monkeypatch):
+    monkeypatch.setattr(dte.agenda, 'get_agenda', fail)
+    with pytest.raises(ValueError):
+        dte.display_weather_on_epaper(resources)
+    assert resources.epd.calls == [('init',), ('sleep',)]
+    resources.close()
+
+def test_panel_sleeps_when_rendering_fails(resources, monkeypatch):
+    monkeypatch.setattr(dte.agenda, 'get_agenda', lambda *args: [])
+    monkeypatch.setattr(resources, 'render', fail)
+    with pytest.raises(ValueError):
+        dte.display_weather_on_epaper(resources)
+    assert resources.epd.calls == [('init',), ('sleep',)]
+    resources.close()
+
+def test_own_resources_are_closed_when_a_stage_fails(resources, closed, monkeypatch):
+    monkeypatch.setattr(dte.agenda, 'get_agenda', fail)
+    monkeypatch.setattr(dte, 'DashboardResources', lambda: resources)
+    with pytest.raises(ValueError):
+        dte.display_weather_on_epaper()
+    assert closed == [resources]
+    assert resources.epd.calls[-1] == ('sleep',)
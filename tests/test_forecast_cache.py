@@ -0,0 +1,70 @@
+"""
+Tests of refreshes of expired cached forecasts while Open-Meteo fails:
+the stale forecast is shown, the circuit breaker counts one failure per
+refresh and the background revalidation ends within its deadline.
+"""
+import threading
+import time
+import numpy as np
+import pytest
+from meteo_data import open_meteo_data as omd
+from meteo_data import resilience
+from meteo_data.forecast_cache import ForecastBlock, ForecastCache
+
+LOCATION = (49.0, 8.4)
+
+class FailingClient:
+    """An Open-Meteo client whose requests always fail."""
+    def __init__(self):
+        self.requests = 0
+
+    def weather_api(self, url, params, timeout):
+        self.requests += 1
+        raise ConnectionError("network down")
+
+def wait_for_revalidation():
+    for thread in threading.enumerate():
+        if thread.name == 'forecast-revalidate':
+            thread.join()
+
+@pytest.fixture
+def breaker(tmp_path, monkeypatch):
+    monkeypatch.setattr(resilience, 'BASE_DIR', str(tmp_path))
+    resilience.get_breaker.cache_clear()
+    yield resilience.get_breaker(omd.SOURCE)
+    wait_for_revalidation()
+    resilience.get_breaker.cache_clear()
+
+@pytest.fixture
+def expired_cache(tmp_path):
+    cache = ForecastCache(str(tmp_path / 'cache'))
+    forecast = {name: ForecastBlock(0, 3 * 3600, 3600, np.ones((count, 3), dtype=np.float32))
+                for name, count in (('hourly', len(omd.HOURLY_VARIABLES)),
+                                    ('daily', len(omd.DAILY_VARIABLES)))}
+    cache.store(omd.forecast_key(*LOCATION), forecast, fetched_at=time.time() - 2 * 3600)
+    return cache
+
+def refresh(client, cache):
+    return omd.fetch_forecast_tables([LOCATION], client, cache=cache,
+                                     deadline=resilience.Deadline(0.1))[0]
+
+def test_failed_refresh_counts_once(breaker, expired_cache, monkeypatch):
+    monkeypatch.setattr(omd, 'REVALIDATE_DEADLINE', 0.1)
+    client = FailingClient()
+    for number in range(1, resilience.FAILURE_THRESHOLD):
+        hourly, _ = refresh(client, expired_cache)
+        wait_for_revalidation()
+        # the stale forecast is shown, the background attempt isn't counted
+        assert hourly.values[0][0] == 1
+        assert breaker.failures == number
+        assert not breaker.is_open()
+    refresh(client, expired_cache)
+    assert breaker.is_open()
+
+def test_revalidation_ends_within_its_deadline(breaker, expired_cache, monkeypatch):
+    monkeypatch.setattr(omd, 'REVALIDATE_DEADLINE', 0.1)
+    refresh(FailingClient(), expired_cache)
+    started = time.monotonic()
+    wait_for_revalidation()
+    # a single attempt, no retries after the deadline
+    assert time.monotonic() - started < resilience.BACKOFF
@@ -0,0 +1,64 @@
+"""
+Tests of the differential refresh against the recording EPD backend.
+"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from e_paper.backends import RecordingEPD
+from e_paper.frame_diff import DifferentialRefresher
+
+SIZE = (800, 480)
+
+def frame(*boxes):
+    """A white frame with black rectangles."""
+    image = Image.new('1', SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    for box in boxes:
+        draw.rectangle(box, fill=0)
+    return image
+
+@pytest.fixture
+def epd():
+    return RecordingEPD(*SIZE)
+
+@pytest.fixture
+def refresher(epd, tmp_path):
+    return DifferentialRefresher(epd, str(tmp_path / 'last_frame.bin'), full_refresh_every=3)
+
+def test_first_frame_is_a_full_refresh(refresher, epd):
+    assert refresher.update(frame((10, 10, 50, 50))) == 'full'
+    assert epd.calls == [('Clear',), ('display', SIZE[0] * SIZE[1] // 8)]
+
+def test_identical_frame_is_skipped(refresher, epd):
+    refresher.update(frame((10, 10, 50, 50)))
+    epd.calls.clear()
+    assert refresher.update(frame((10, 10, 50, 50))) == 'skip'
+    assert epd.calls == []
+
+def test_small_change_is_a_partial_refresh_of_whole_bytes(refresher, epd):
+    refresher.update(frame((10, 10, 50, 50)))
+    epd.calls.clear()
+    assert refresher.update(frame((10, 10, 50, 50), (203, 101, 210, 119))) == 'partial'
+    assert epd.calls == [('init_part',), ('display_Partial', 200, 101, 216, 120)]
+    # the packed, inverted bytes of the window
+    window = np.frombuffer(epd.buffer, dtype=np.uint8).reshape(19, 2)
+    assert window[:, 0].tolist() == [0b00011111] * 19
+    assert window[:, 1].tolist() == [0b11100000] * 19
+
+def test_full_refresh_after_the_partial_limit(refresher):
+    modes = [refresher.update(frame((10, 10, 50 + number, 50))) for number in range(6)]
+    assert modes == ['full', 'partial', 'partial', 'partial', 'full', 'partial']
+
+def test_large_change_is_a_full_refresh(refresher):
+    refresher.update(frame((10, 10, 50, 50)))
+    assert refresher.update(frame((0, 0, 700, 400))) == 'full'
+
+def test_missing_last_frame_gives_a_full_refresh(refresher, tmp_path):
+    refresher.update(frame((10, 10, 50, 50)))
+    (tmp_path / 'last_frame.bin').unlink()
+    assert refresher.update(frame((10, 10, 50, 50))) == 'full'
+
+def test_last_frame_of_another_size_gives_a_full_refresh(refresher, tmp_path):
+    refresher.update(frame((10, 10, 50, 50)))
+    (tmp_path / 'last_frame.bin').write_bytes(b'\0' * 1000)
+    assert refresher.update(frame((10, 10, 50, 50))) == 'full'
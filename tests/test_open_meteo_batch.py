@@ -0,0 +1,155 @@
+"""
+Tests of the batched forecast requests against a local stub of the
+Open-Meteo API which answers with FlatBuffers responses.
+"""
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import flatbuffers
+import numpy as np
+import pytest
+from meteo_data import open_meteo_data as omd
+from meteo_data import resilience
+from meteo_data.forecast_cache import ForecastCache
+
+START = 1767225600
+HOURS = 72
+DAYS = 3
+
+# vtable slots of the openmeteo_sdk tables, (field offset - 4) / 2
+RESPONSE_LATITUDE, RESPONSE_LONGITUDE, RESPONSE_DAILY, RESPONSE_HOURLY = 0, 1, 10, 11
+BLOCK_TIME, BLOCK_TIME_END, BLOCK_INTERVAL, BLOCK_VARIABLES = 0, 1, 2, 3
+VARIABLE_VALUES = 3
+
+def _block(builder, interval, columns):
+    """Build a VariablesWithTime table with one VariableWithValues per column."""
+    variables = []
+    for values in columns:
+        vector = builder.CreateNumpyVector(np.asarray(values, dtype=np.float32))
+        builder.StartObject(14)
+        builder.PrependUOffsetTRelativeSlot(VARIABLE_VALUES, vector, 0)
+        variables.append(builder.EndObject())
+    builder.StartVector(4, len(variables), 4)
+    for variable in reversed(variables):
+        builder.PrependUOffsetTRelative(variable)
+    vector = builder.EndVector()
+    builder.StartObject(4)
+    builder.PrependInt64Slot(BLOCK_TIME, START, 0)
+    builder.PrependInt64Slot(BLOCK_TIME_END, START + len(columns[0]) * interval, 0)
+    builder.PrependInt32Slot(BLOCK_INTERVAL, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(BLOCK_VARIABLES, vector, 0)
+    return builder.EndObject()
+
+def response_bytes(latitude, longitude, hourly_count, daily_count):
+    """
+    A size prefixed WeatherApiResponse. Every value of the forecast is the
+    latitude, so the location of a decoded forecast can be told.
+    """
+    builder = flatbuffers.Builder(1024)
+    hourly = _block(builder, 3600, [np.full(HOURS, latitude)] * hourly_count)
+    daily = _block(builder, 86400, [np.full(DAYS, latitude)] * daily_count)
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(RESPONSE_LATITUDE, latitude, 0)
+    builder.PrependFloat32Slot(RESPONSE_LONGITUDE, longitude, 0)
+    builder.PrependUOffsetTRelativeSlot(RESPONSE_DAILY, daily, 0)
+    builder.PrependUOffsetTRelativeSlot(RESPONSE_HOURLY, hourly, 0)
+    builder.Finish(builder.EndObject())
+    data = bytes(builder.Output())
+    return struct.pack('<I', len(data)) + data
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers a forecast request with one response per requested location."""
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        latitudes = [float(value) for value in query['latitude'][0].split(',')]
+        longitudes = [float(value) for value in query['longitude'][0].split(',')]
+        self.server.requests.append(list(zip(latitudes, longitudes)))
+        responses = [response_bytes(latitude, longitude, len(query['hourly']),
+                                    len(query['daily']))
+                     for latitude, longitude in zip(latitudes, longitudes)]
+        body = b''.join(responses[:len(responses) - self.server.missing_responses])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    # a circuit breaker of its own, the one of the installation is left alone
+    monkeypatch.setattr(resilience, 'BASE_DIR', str(tmp_path))
+    resilience.get_breaker.cache_clear()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.missing_responses = 0
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/v1/forecast'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    resilience.get_breaker.cache_clear()
+
+def locations(count):
+    return [(float(number), float(number) / 2) for number in range(count)]
+
+@pytest.mark.parametrize('count', [1, omd.MAX_LOCATIONS_PER_REQUEST,
+                                   2 * omd.MAX_LOCATIONS_PER_REQUEST + 3])
+def test_one_request_per_batch(stub, count):
+    forecasts = omd.fetch_forecast_blocks(locations(count), omd.create_client(), stub.url)
+    size = omd.MAX_LOCATIONS_PER_REQUEST
+    assert stub.requests == [locations(count)[i:i + size] for i in range(0, count, size)]
+    assert len(forecasts) == count
+
+def test_forecasts_in_the_order_of_the_locations(stub):
+    requested = locations(2 * omd.MAX_LOCATIONS_PER_REQUEST + 3)
+    forecasts = omd.fetch_forecast_blocks(requested, omd.create_client(), stub.url)
+    for (latitude, _), forecast in zip(requested, forecasts):
+        assert forecast['hourly'].values.shape == (len(omd.HOURLY_VARIABLES), HOURS)
+        assert forecast['daily'].values.shape == (len(omd.DAILY_VARIABLES), DAYS)
+        assert np.all(forecast['hourly'].values == latitude)
+        assert np.all(forecast['daily'].values == latitude)
+
+def test_dataframes_in_the_order_of_the_locations(stub):
+    requested = locations(omd.MAX_LOCATIONS_PER_REQUEST + 1)
+    forecasts = omd.fetch_forecasts(requested, omd.create_client(), stub.url)
+    assert len(stub.requests) == 2
+    for (latitude, _), (hourly, daily) in zip(requested, forecasts):
+        assert list(hourly.columns) == omd.HOURLY_COLUMNS
+        assert len(hourly) == HOURS and len(daily) == DAYS
+        assert (hourly['temperature_2m'] == latitude).all()
+        assert (daily['temperature_2m_max'] == latitude).all()
+
+def test_cached_locations_are_not_requested_again(stub, tmp_path):
+    cache = ForecastCache(str(tmp_path / 'cache'))
+    client = omd.create_client()
+    omd.fetch_forecast_tables(locations(3), client, stub.url, cache)
+    forecasts = omd.fetch_forecast_tables(locations(5), client, stub.url, cache)
+    assert stub.requests == [locations(3), locations(5)[3:]]
+    assert [hourly.values[0][0] for hourly, _ in forecasts] == [0, 1, 2, 3, 4]
+
+def test_missing_response_raises(stub):
+    stub.missing_responses = 1
+    with pytest.raises(ValueError, match="Expected 3 responses, got 2"):
+        omd.fetch_forecast_blocks(locations(3), omd.create_client(), stub.url)
+    # no retry, the count is checked on the answer
+    assert len(stub.requests) == 1
+
+def test_weather_follows_the_cache(stub, tmp_path):
+    cache = ForecastCache(str(tmp_path / 'cache'))
+    weather = omd.OpenMeteoWeather(1.0, 0.5, cache)
+    weather.url = stub.url
+    assert (weather.get_weather_hourly()['temperature_2m'] == 1.0).all()
+    assert (weather.get_weather_daily()['temperature_2m_max'] == 1.0).all()
+    # served from the cache while it is current
+    assert len(stub.requests) == 1
+    key = omd.forecast_key(1.0, 0.5)
+    forecast, _ = cache.load(key)
+    cache.store(key, {name: block._replace(values=block.values + 1)
+                      for name, block in forecast.items()})
+    # a long-lived instance sees the new forecast
+    assert (weather.get_weather_hourly()['temperature_2m'] == 2.0).all()
+    assert (weather.get_weather_daily()['temperature_2m_max'] == 2.0).all()
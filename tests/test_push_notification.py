@@ -0,0 +1,67 @@
+"""
+Tests of the birthday push delivery against a local stub of the Pushbullet API.
+"""
+import pushbullet
+import pytest
+from birthday_push_message import push_notification, scheduler
+from birthday_push_message.push_notification import PushNotifier
+from birthday_push_message.pushbullet_stub import (ACCOUNT_DATA, FAILING_TITLE, client_urls,
+                                                   start_stub)
+
+MESSAGES = [f"Today is Person {number}'s {20 + number}th birthday!" for number in range(8)]
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = start_stub()
+    # every client created by the notifier sends to the stub
+    for name, url in client_urls(server).items():
+        monkeypatch.setattr(pushbullet.Pushbullet, name, url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def notifier(stub):
+    notifier = PushNotifier('key')
+    yield notifier
+    notifier.close()
+
+def test_every_push_arrives_when_one_is_refused(stub, notifier):
+    pushes = [("Birthday Reminder", message) for message in MESSAGES]
+    pushes.insert(len(pushes) // 2, (FAILING_TITLE, 'refused'))
+    sent = notifier.send_all(pushes)
+    assert sent == [title != FAILING_TITLE for title, _ in pushes]
+    assert sorted(push['body'] for push in stub.pushes) == sorted(MESSAGES)
+
+def test_digest_is_one_push(stub, notifier):
+    assert notifier.send_digest("Birthday Reminder", MESSAGES)
+    assert [(push['title'], push['body']) for push in stub.pushes] == [
+        ("Birthday Reminder", '\n'.join(MESSAGES))]
+
+def test_empty_digest_sends_nothing(stub, notifier):
+    assert notifier.send_digest("Birthday Reminder", [])
+    assert stub.requests == 0
+
+def test_client_is_created_once(stub, notifier):
+    notifier.send_all([("Birthday Reminder", message) for message in MESSAGES])
+    notifier.send("Birthday Reminder", MESSAGES[0])
+    notifier.send_digest("Birthday Reminder", MESSAGES)
+    # the account data of one client, then only pushes
+    assert stub.account_requests == len(ACCOUNT_DATA)
+    assert len(stub.pushes) == len(MESSAGES) + 2
+
+def test_notifier_is_shared_per_api_key():
+    assert push_notification.get_notifier('a') is push_notification.get_notifier('a')
+    assert push_notification.get_notifier('a') is not push_notification.get_notifier('b')
+
+@pytest.mark.parametrize('digest, bodies', [(True, ['\n'.join(MESSAGES[:3])]),
+                                            (False, MESSAGES[:3])])
+def test_birthday_messages(stub, notifier, monkeypatch, digest, bodies):
+    monkeypatch.setattr(scheduler, 'get_notifier', lambda api_key: notifier)
+    assert scheduler.send_birthday_messages('key', MESSAGES[:3], digest)
+    assert sorted(push['body'] for push in stub.pushes) == sorted(bodies)
+
+def test_birthday_messages_are_separate_pushes_by_default(stub, notifier, monkeypatch):
+    monkeypatch.setattr(scheduler, 'get_notifier', lambda api_key: notifier)
+    assert scheduler.send_birthday_messages('key', MESSAGES[:3])
+    assert sorted(push['body'] for push in stub.pushes) == sorted(MESSAGES[:3])
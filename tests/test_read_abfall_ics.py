@@ -0,0 +1,63 @@
+"""
+Tests of the streaming ICS reader: calendars not in date order and UTC
+start times of local midnight.
+"""
+import datetime
+import time
+import pytest
+from abfallkalender import read_abfall_ics, recurrence
+
+def write_calendar(path, events):
+    """Write (DTSTART line, summary) events to an ICS file."""
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//tests//abfallkalender//DE"]
+    for number, (dtstart, summary) in enumerate(events):
+        lines += ["BEGIN:VEVENT", f"UID:{number}@tests", dtstart, f"SUMMARY:{summary}",
+                  "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    path.write_text("\r\n".join(lines) + "\r\n", encoding='utf-8')
+    return str(path)
+
+@pytest.fixture
+def berlin(monkeypatch):
+    """Run the test in German local time."""
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    recurrence.occurrences_between.cache_clear()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+    recurrence.occurrences_between.cache_clear()
+
+def test_unsorted_calendar_keeps_every_event(tmp_path):
+    calendar = write_calendar(tmp_path / 'abfall.ics', [
+        ("DTSTART;VALUE=DATE:20240305", "Papier"),
+        ("DTSTART;VALUE=DATE:20240110", "Biomüll")])
+    events = read_abfall_ics.get_events_between(calendar, datetime.date(2024, 1, 1),
+                                                datetime.date(2024, 1, 31))
+    assert [(event['start'], event['summary']) for event in events] == [
+        (datetime.date(2024, 1, 10), "Biomüll")]
+
+def test_assume_sorted_stops_after_the_window(tmp_path):
+    calendar = write_calendar(tmp_path / 'abfall.ics', [
+        ("DTSTART;VALUE=DATE:20240110", "Biomüll"),
+        ("DTSTART;VALUE=DATE:20240305", "Papier"),
+        ("DTSTART;VALUE=DATE:20240115", "Restmüll")])
+    events = read_abfall_ics.get_events_between(calendar, datetime.date(2024, 1, 1),
+                                                datetime.date(2024, 1, 31),
+                                                assume_sorted=True)
+    assert [event['summary'] for event in events] == ["Biomüll"]
+
+def test_utc_midnight_is_the_local_day(tmp_path, berlin):
+    calendar = write_calendar(tmp_path / 'abfall.ics', [
+        ("DTSTART:20240109T230000Z", "Papier"),
+        ("DTSTART:20240709T220000Z", "Biomüll")])
+    assert [event['start'] for event in read_abfall_ics.parse_events(calendar)] == [
+        datetime.date(2024, 1, 10), datetime.date(2024, 7, 10)]
+
+def test_utc_until_includes_the_last_local_day(berlin):
+    # every other week from local midnight, the last one given as 23:00Z
+    occurrences = recurrence.iter_occurrences(
+        "FREQ=WEEKLY;INTERVAL=2;UNTIL=20240206T230000Z", datetime.date(2024, 1, 10),
+        frozenset(), datetime.date(2024, 1, 1), datetime.date(2024, 3, 31))
+    assert list(occurrences) == [datetime.date(2024, 1, 10), datetime.date(2024, 1, 24),
+                                 datetime.date(2024, 2, 7)]
@@ -0,0 +1,121 @@
+"""
+Tests of the expansion of recurring waste collection events, on synthetic
+calendars compared with a complete expansion by dateutil.
+"""
+import datetime
+import pytest
+from dateutil.rrule import rrulestr
+from abfallkalender import ics_index, read_abfall_ics, recurrence
+
+# (summary, DTSTART line, RRULE, EXDATE line or None)
+RECURRING_EVENTS = [
+    ("Papier", "DTSTART;VALUE=DATE:20240105",
+     "FREQ=WEEKLY;INTERVAL=2;UNTIL=20261231", None),
+    ("Biomüll", "DTSTART;VALUE=DATE:20240110",
+     "FREQ=WEEKLY;COUNT=10", "EXDATE;VALUE=DATE:20240124,20240214"),
+    ("Restmüll", "DTSTART:20240103T060000Z",
+     "FREQ=WEEKLY;INTERVAL=2;UNTIL=20250101T060000Z", None),
+    ("Gelber Sack", "DTSTART:20240102T070000",
+     "FREQ=WEEKLY;INTERVAL=2;COUNT=20", "EXDATE:20240116T070000,20240213T070000"),
+    ("Sperrmüll", "DTSTART;VALUE=DATE:20240101",
+     "FREQ=MONTHLY;BYDAY=1MO", None),
+]
+CATEGORIES = {summary: summary for summary, _, _, _ in RECURRING_EVENTS}
+
+WINDOWS = [
+    (datetime.date(2023, 12, 1), datetime.date(2024, 1, 31)),
+    (datetime.date(2024, 1, 5), datetime.date(2024, 1, 6)),
+    (datetime.date(2024, 3, 1), datetime.date(2024, 12, 31)),
+    (datetime.date(2024, 12, 20), datetime.date(2025, 1, 10)),
+    (datetime.date(2026, 12, 1), datetime.date(2027, 2, 1)),
+]
+
+def write_calendar(path):
+    """Write the recurring events and one single event to an ICS file."""
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//tests//abfallkalender//DE"]
+    for number, (summary, dtstart, rrule, exdate) in enumerate(RECURRING_EVENTS):
+        lines += ["BEGIN:VEVENT", f"UID:{number}@tests", dtstart, f"RRULE:{rrule}"]
+        if exdate:
+            lines.append(exdate)
+        lines += [f"SUMMARY:{summary}", "END:VEVENT"]
+    lines += ["BEGIN:VEVENT", "UID:single@tests", "DTSTART;VALUE=DATE:20240520",
+              "SUMMARY:Papier", "END:VEVENT", "END:VCALENDAR"]
+    path.write_text("\r\n".join(lines) + "\r\n", encoding='utf-8')
+    return str(path)
+
+def brute_force(start, end):
+    """All occurrences within the window, by expanding every rule completely."""
+    occurrences = [(day, summary) for day, summary in [(datetime.date(2024, 5, 20), "Papier")]
+                   if start <= day <= end]
+    for summary, dtstart, rrule, exdate in RECURRING_EVENTS:
+        text = "\n".join(line for line in (dtstart, f"RRULE:{rrule}", exdate) if line)
+        rule = rrulestr(text, forceset=True)
+        # the rule without an end is expanded up to the last window
+        until = datetime.datetime(2027, 12, 31, tzinfo=rule[0].tzinfo)
+        for occurrence in rule.between(rule[0] - datetime.timedelta(days=1), until):
+            if start <= occurrence.date() <= end:
+                occurrences.append((occurrence.date(), summary))
+    return sorted(occurrences)
+
+@pytest.fixture
+def calendar(tmp_path):
+    recurrence.occurrences_between.cache_clear()
+    return write_calendar(tmp_path / 'abfall.ics')
+
+@pytest.mark.parametrize('start, end', WINDOWS)
+def test_streaming_matches_brute_force(calendar, start, end):
+    events = read_abfall_ics.get_events_between(calendar, start, end, CATEGORIES,
+                                                assume_sorted=False)
+    assert sorted((event['start'], event['summary']) for event in events) == \
+        brute_force(start, end)
+
+@pytest.mark.parametrize('start, end', WINDOWS)
+def test_index_matches_brute_force(calendar, start, end):
+    events = read_abfall_ics.iter_indexed_events(calendar, start, end)
+    assert sorted((event['start'], event['summary']) for event in events) == \
+        brute_force(start, end)
+
+def test_expand_event_keeps_duration():
+    event = {'summary': "Papier", 'start': datetime.date(2024, 1, 5),
+             'end': datetime.date(2024, 1, 6), 'rrule': "FREQ=WEEKLY;INTERVAL=2",
+             'exdates': {datetime.date(2024, 1, 19)}}
+    occurrences = list(recurrence.expand_event(event, datetime.date(2024, 1, 1),
+                                               datetime.date(2024, 2, 29)))
+    assert [occurrence['start'] for occurrence in occurrences] == [
+        datetime.date(2024, 1, 5), datetime.date(2024, 2, 2), datetime.date(2024, 2, 16)]
+    assert all(occurrence['end'] - occurrence['start'] == datetime.timedelta(days=1)
+               for occurrence in occurrences)
+
+def test_rule_without_end_is_expanded_lazily():
+    # would never finish if the whole rule was expanded
+    occurrences = list(recurrence.iter_occurrences(
+        "FREQ=DAILY", datetime.date(2000, 1, 1), frozenset(),
+        datetime.date(2024, 1, 1), datetime.date(2024, 1, 3)))
+    assert occurrences == [datetime.date(2024, 1, 1), datetime.date(2024, 1, 2),
+                           datetime.date(2024, 1, 3)]
+
+def test_second_query_is_served_from_index_windows(calendar, monkeypatch):
+    start, end = WINDOWS[2]
+    index = read_abfall_ics.load_index(calendar)
+    first = ics_index.events_between(index, start, end, calendar)
+    assert f'{start.isoformat()}/{end.isoformat()}' in index['windows']
+
+    def fail(*args):
+        raise AssertionError("expanded again")
+    monkeypatch.setattr(recurrence, 'expand_event', fail)
+    assert ics_index.events_between(index, start, end, calendar) == first
+    # the window was written to the index file as well
+    assert ics_index.events_between(ics_index.load_index(calendar), start, end) == first
+
+def test_second_expansion_is_served_from_lru_cache(calendar, monkeypatch):
+    start, end = WINDOWS[2]
+    first = read_abfall_ics.get_events_between(calendar, start, end, CATEGORIES,
+                                               assume_sorted=False)
+
+    def fail(*args):
+        raise AssertionError("expanded again")
+    monkeypatch.setattr(recurrence, 'iter_occurrences', fail)
+    hits = recurrence.occurrences_between.cache_info().hits
+    assert read_abfall_ics.get_events_between(calendar, start, end, CATEGORIES,
+                                              assume_sorted=False) == first
+    assert recurrence.occurrences_between.cache_info().hits == hits + len(RECURRING_EVENTS)
@@ -0,0 +1,44 @@
+"""
+Tests of the text cache: every static label of the dashboard must give the
+same pixels as draw.text, at both font sizes.
+"""
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+from abfallkalender.read_abfall_ics import WASTE_CATEGORIES
+from e_paper import display_to_epaper as dte
+from e_paper.text_cache import TextRenderer, render_mask
+
+SIZES = [24, 18]
+
+LABELS = (dte.measurements_list + dte.units_list + list(dte.days_dict.values())
+          + ['Temp min/max', 'N-Summe', 'Beschreibung', 'Wetter: keine Daten']
+          + [f'{day}: {summary}' for day in ('Heute', 'Morgen')
+             for summary in WASTE_CATEGORIES.values()])
+
+NUMBERS = ['0', '7', '-3.5', '12.8 / 21.4', '06:00', '23:59', '17.10.2026', '1,5', '100']
+
+def draw_both(text, font, position=(7, 5)):
+    """Return the text drawn by draw.text and by the renderer."""
+    expected = Image.new('1', (420, 60), 255)
+    ImageDraw.Draw(expected).text(position, text, font=font, fill=0)
+    drawn = Image.new('1', (420, 60), 255)
+    TextRenderer().draw(drawn, position, text, font)
+    return expected, drawn
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('text', LABELS + NUMBERS)
+def test_same_pixels_as_draw_text(text, size):
+    expected, drawn = draw_both(text, ImageFont.truetype(dte.FONT_PATH, size))
+    assert ImageChops.difference(expected, drawn).getbbox() is None
+
+@pytest.mark.parametrize('size', SIZES)
+def test_mask_is_cropped_to_the_ink(size):
+    font = ImageFont.truetype(dte.FONT_PATH, size)
+    mask, _ = render_mask('Heute: Papier', font)
+    assert mask.getbbox() == (0, 0) + mask.size
+
+def test_text_without_ink():
+    font = ImageFont.truetype(dte.FONT_PATH, 18)
+    assert render_mask('   ', font) is None
+    expected, drawn = draw_both(' - ', font)
+    assert ImageChops.difference(expected, drawn).getbbox() is None